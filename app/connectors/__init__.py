@@ -1,5 +1,14 @@
 import typing
-from typing import Callable, Coroutine, Generic, Literal, TypeAlias, TypeVar, TypedDict
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Generic,
+    Literal,
+    TypeAlias,
+    TypeVar,
+    TypedDict,
+)
 from discord import Embed
 
 from modules.objects.articles import BaseArticle
@@ -14,7 +23,10 @@ ConnectorInput = TypeVar("ConnectorInput")
 
 class Connector(TypedDict, Generic[ConnectorInput]):
     format: Callable[[list[BaseArticle], str], ConnectorInput]
-    send_messages: Callable[[list[str], ConnectorInput], Coroutine[None, None, None]]
+    # JSON bodies to post to the webhook, one for each message
+    payloads: Callable[[ConnectorInput], list[dict[str, Any]]]
+    # Fixes a payload rejected by the webhook with the given error, if possible
+    repair: Callable[[dict[str, Any], str], dict[str, Any] | None]
     validate: Callable[[str], Coroutine[None, None, bool]]
 
 
@@ -27,17 +39,20 @@ class ConnectorOverview(TypedDict, total=True):
 connectors: ConnectorOverview = {
     "discord": {
         "format": discord.format,
-        "send_messages": discord.send_messages,
+        "payloads": discord.payloads,
+        "repair": discord.repair,
         "validate": discord.validate,
     },
     "slack": {
         "format": slack.format,
-        "send_messages": slack.send_messages,
+        "payloads": slack.payloads,
+        "repair": slack.repair,
         "validate": slack.validate,
     },
     "teams": {
         "format": teams.format,
-        "send_messages": teams.send_messages,
+        "payloads": teams.payloads,
+        "repair": teams.repair,
         "validate": teams.validate,
     },
 }
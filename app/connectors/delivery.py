@@ -0,0 +1,310 @@
+"""
+Delivery of webhook messages. Every connector formats its messages as JSON payloads,
+which are posted to their destination one at a time while following the rate limits
+given in the response headers. Failed deliveries are retried with backoff, and those
+that can't be retried within the run are kept in a local SQLite file until they're due
+"""
+
+import asyncio
+from collections import deque
+from collections.abc import Mapping
+import json
+from logging import getLogger
+import os
+import sqlite3
+import time
+from typing import Any
+
+import aiohttp
+from multidict import CIMultiDictProxy
+from pydantic import BaseModel
+
+from app import config_options
+from app.users.schemas import Webhook
+
+from . import WebhookType, connectors
+from .runtime import connector_runtime
+
+logger = getLogger("osinter")
+
+
+class Delivery(BaseModel):
+    webhook_id: str
+    url: str
+    hook_type: WebhookType
+    payload: dict[str, Any]
+
+    attempts: int = 0
+    # Row in the retry store, for deliveries loaded from it
+    store_id: int | None = None
+
+
+class RetryStore:
+    """Deliveries waiting to be retried, stored in a local SQLite file"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        with self.connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS deliveries (
+                    id INTEGER PRIMARY KEY,
+                    webhook_id TEXT NOT NULL,
+                    hook_type TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    not_before REAL NOT NULL
+                )"""
+            )
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10)
+
+    def due(self) -> list[tuple[int, str, WebhookType, dict[str, Any], int]]:
+        with self.connect() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, webhook_id, hook_type, payload, attempts FROM deliveries
+                WHERE not_before <= ? ORDER BY id""",
+                (time.time(),),
+            ).fetchall()
+
+        return [
+            (id, webhook_id, hook_type, json.loads(payload), attempts)
+            for id, webhook_id, hook_type, payload, attempts in rows
+        ]
+
+    def defer(self, delivery: Delivery, delay: float) -> None:
+        with self.connect() as conn:
+            if delivery.store_id is None:
+                conn.execute(
+                    """
+                    INSERT INTO deliveries
+                    (webhook_id, hook_type, payload, attempts, not_before)
+                    VALUES (?, ?, ?, ?, ?)""",
+                    (
+                        delivery.webhook_id,
+                        delivery.hook_type,
+                        json.dumps(delivery.payload),
+                        delivery.attempts,
+                        time.time() + delay,
+                    ),
+                )
+            else:
+                # The payload might have been repaired since it was stored
+                conn.execute(
+                    """
+                    UPDATE deliveries SET payload = ?, attempts = ?, not_before = ?
+                    WHERE id = ?""",
+                    (
+                        json.dumps(delivery.payload),
+                        delivery.attempts,
+                        time.time() + delay,
+                        delivery.store_id,
+                    ),
+                )
+
+    def remove(self, delivery: Delivery) -> None:
+        if delivery.store_id is None:
+            return
+
+        with self.connect() as conn:
+            conn.execute("DELETE FROM deliveries WHERE id = ?", (delivery.store_id,))
+
+    def remove_ids(self, ids: list[int]) -> None:
+        with self.connect() as conn:
+            conn.executemany(
+                "DELETE FROM deliveries WHERE id = ?", [(id,) for id in ids]
+            )
+
+
+def parse_seconds(value: str | None) -> float | None:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class DeliveryScheduler:
+    """
+    Posts deliveries in order for each destination, while destinations are served
+    concurrently up to the per host limit of the connector runtime. Each destination
+    tracks the time until which its rate limit is exhausted, as given by the
+    X-RateLimit headers from Discord or the Retry-After header of a 429 response
+    """
+
+    def __init__(
+        self, store: RetryStore, max_attempts: int, max_wait: float, backoff: float
+    ) -> None:
+        self.store = store
+        self.max_attempts = max_attempts
+        self.max_wait = max_wait
+        self.backoff = backoff
+
+        # Time until which each destination shouldn't be sent to
+        self.blocked_until: dict[str, float] = {}
+
+    def load_due(self, webhooks: Mapping[str, Webhook]) -> list[Delivery]:
+        """Deliveries from the retry store that are due, for webhooks still existing"""
+        deliveries: list[Delivery] = []
+        removed_ids: list[int] = []
+
+        for id, webhook_id, hook_type, payload, attempts in self.store.due():
+            webhook = webhooks.get(webhook_id)
+
+            if not webhook or webhook.hook_type != hook_type:
+                removed_ids.append(id)
+                continue
+
+            deliveries.append(
+                Delivery(
+                    webhook_id=webhook_id,
+                    # The url might have changed since the delivery was stored
+                    url=webhook.url.get_secret_value(),
+                    hook_type=hook_type,
+                    payload=payload,
+                    attempts=attempts,
+                    store_id=id,
+                )
+            )
+
+        if removed_ids:
+            self.store.remove_ids(removed_ids)
+
+        return deliveries
+
+    async def run(
+        self, deliveries: list[Delivery], webhooks: Mapping[str, Webhook]
+    ) -> None:
+        """Delivers the new deliveries along with any stored ones that are due"""
+        by_destination: dict[str, deque[Delivery]] = {}
+
+        for delivery in [*self.load_due(webhooks), *deliveries]:
+            by_destination.setdefault(delivery.url, deque()).append(delivery)
+
+        if by_destination:
+            logger.debug(
+                f"Delivering {sum(len(queue) for queue in by_destination.values())} messages to {len(by_destination)} destinations"
+            )
+
+        await asyncio.gather(
+            *(self.drain(url, queue) for url, queue in by_destination.items())
+        )
+
+    async def drain(self, url: str, queue: deque[Delivery]) -> None:
+        throttled = 0
+
+        while queue:
+            wait = self.blocked_until.get(url, 0) - time.monotonic()
+
+            if wait > self.max_wait:
+                # Kept for a later run rather than holding up this one
+                for delivery in queue:
+                    self.postpone(delivery, wait, "rate limited")
+                return
+            elif wait > 0:
+                await asyncio.sleep(wait)
+
+            delivery = queue[0]
+
+            try:
+                async with connector_runtime.limit(url):
+                    async with connector_runtime.session.post(
+                        url, json=delivery.payload
+                    ) as response:
+                        body = await response.text()
+                        self.track_rate_limit(url, response.status, response.headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                self.fail(url, queue, f"{type(e).__name__}: {e}")
+                continue
+
+            if response.status < 300:
+                self.store.remove(queue.popleft())
+            elif response.status == 429:
+                # Retried once the rate limit has reset, unless the destination keeps
+                # rejecting deliveries
+                throttled += 1
+                if throttled >= self.max_attempts:
+                    for delivery in queue:
+                        self.postpone(delivery, self.max_wait, "rate limited")
+                    return
+            elif response.status >= 500:
+                self.fail(url, queue, f"status {response.status}")
+            else:
+                self.reject(queue, response.status, body)
+
+    def track_rate_limit(
+        self, url: str, status: int, headers: CIMultiDictProxy[str]
+    ) -> None:
+        now = time.monotonic()
+        reset_after = parse_seconds(headers.get("X-RateLimit-Reset-After"))
+
+        if headers.get("X-RateLimit-Remaining") == "0" and reset_after is not None:
+            self.blocked_until[url] = now + reset_after
+
+        if status == 429:
+            retry_after = parse_seconds(headers.get("Retry-After")) or reset_after
+            self.blocked_until[url] = max(
+                self.blocked_until.get(url, 0), now + (retry_after or self.backoff)
+            )
+
+    def fail(self, url: str, queue: deque[Delivery], error: str) -> None:
+        """Retries the first delivery with backoff, after a transient error"""
+        delivery = queue[0]
+        delivery.attempts += 1
+
+        if delivery.attempts >= self.max_attempts:
+            logger.error(
+                f'Dropping delivery to webhook "{delivery.webhook_id}" after {delivery.attempts} attempts: {error}'
+            )
+            self.store.remove(queue.popleft())
+            return
+
+        delay = self.backoff * 2 ** (delivery.attempts - 1)
+        logger.warning(
+            f'Failed delivery to webhook "{delivery.webhook_id}", retrying in {delay}s: {error}'
+        )
+
+        if delay > self.max_wait:
+            self.store.defer(queue.popleft(), delay)
+        else:
+            self.blocked_until[url] = time.monotonic() + delay
+
+    def postpone(self, delivery: Delivery, delay: float, reason: str) -> None:
+        """
+        Keeps a delivery for a later run, which counts as an attempt so that
+        destinations that never accept deliveries don't keep them around forever
+        """
+        delivery.attempts += 1
+
+        if delivery.attempts >= self.max_attempts:
+            logger.error(
+                f'Dropping delivery to webhook "{delivery.webhook_id}" after {delivery.attempts} attempts: {reason}'
+            )
+            self.store.remove(delivery)
+        else:
+            self.store.defer(delivery, delay)
+
+    def reject(self, queue: deque[Delivery], status: int, body: str) -> None:
+        """Handles responses rejecting the payload, which won't succeed if retried"""
+        delivery = queue[0]
+        payload = connectors[delivery.hook_type]["repair"](delivery.payload, body)
+
+        if payload is not None and payload != delivery.payload:
+            delivery.payload = payload
+            return
+
+        logger.error(
+            f'Delivery to webhook "{delivery.webhook_id}" was rejected with status {status}: {body[:200]}'
+        )
+        self.store.remove(queue.popleft())
+
+
+delivery_scheduler = DeliveryScheduler(
+    RetryStore(config_options.WEBHOOK_RETRY_DB),
+    config_options.WEBHOOK_MAX_ATTEMPTS,
+    config_options.WEBHOOK_MAX_WAIT,
+    config_options.WEBHOOK_RETRY_BACKOFF,
+)
@@ -1,11 +1,11 @@
-import asyncio
-from typing import Any, Coroutine
+from typing import Any
 from discord import Embed, Webhook
-import aiohttp
 
 from modules.objects import BaseArticle
 from app import config_options
 
+from .runtime import connector_runtime
+
 
 def format(articles: list[BaseArticle], feed_name: str) -> list[list[Embed]]:
     def create_embed(article: BaseArticle) -> Embed:
@@ -40,32 +40,26 @@ def format(articles: list[BaseArticle], feed_name: str) -> list[list[Embed]]:
     return batches
 
 
-async def send_messages(urls: list[str], message_batches: list[list[Embed]]) -> None:
-    async with aiohttp.ClientSession() as session:
-        send_actions: list[Coroutine[Any, Any, None]] = []
+def payloads(message_batches: list[list[Embed]]) -> list[dict[str, Any]]:
+    return [
+        {
+            "content": "",
+            "embeds": [embed.to_dict() for embed in messages],
+            "username": "OSINTer",
+            "avatar_url": config_options.SMALL_LOGO_URL,
+        }
+        for messages in message_batches
+    ]
 
-        for url in urls:
-            try:
-                webhook = Webhook.from_url(url, session=session)
-                for messages in message_batches:
-                    action = webhook.send(
-                        "",
-                        wait=False,
-                        embeds=messages,
-                        username="OSINTer",
-                        avatar_url=config_options.SMALL_LOGO_URL,
-                    )
-                    send_actions.append(action)
-            except ValueError:
-                pass
 
-        await asyncio.gather(*send_actions, return_exceptions=True)
+def repair(payload: dict[str, Any], error: str) -> dict[str, Any] | None:
+    return None
 
 
 async def validate(url: str) -> bool:
     try:
-        async with aiohttp.ClientSession() as session:
-            webhook = Webhook.from_url(url, session=session)
+        webhook = Webhook.from_url(url, session=connector_runtime.session)
+        async with connector_runtime.limit(url):
             await webhook.send("Initializing webhook from OSINTer...", silent=True)
         return True
     except:
@@ -0,0 +1,69 @@
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+import aiohttp
+from yarl import URL
+
+from app import config_options
+
+
+class ConnectorRuntime:
+    """
+    Owns the HTTP session shared by all connectors, so that deliveries reuse pooled
+    keep-alive connections and cached DNS lookups instead of opening a session per
+    send. Concurrent deliveries are limited per host, so that a run with thousands of
+    deliveries doesn't flood a single service
+    """
+
+    def __init__(
+        self, pool_size: int, host_concurrency: int, dns_ttl: int, timeout: float
+    ) -> None:
+        self.pool_size = pool_size
+        self.host_concurrency = host_concurrency
+        self.dns_ttl = dns_ttl
+        self.timeout = timeout
+
+        self._session: aiohttp.ClientSession | None = None
+        self.host_limits: dict[str, asyncio.Semaphore] = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily, as the session has to be created within the event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=self.pool_size,
+                    ttl_dns_cache=self.dns_ttl,
+                    keepalive_timeout=60,
+                ),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+        return self._session
+
+    @asynccontextmanager
+    async def limit(self, url: str) -> AsyncIterator[None]:
+        """Holds one of the delivery slots for the host of the url"""
+        host = URL(url).host or ""
+
+        if host not in self.host_limits:
+            self.host_limits[host] = asyncio.Semaphore(self.host_concurrency)
+
+        async with self.host_limits[host]:
+            yield
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+        # Semaphores are bound to the event loop they're first used in
+        self.host_limits = {}
+
+
+connector_runtime = ConnectorRuntime(
+    config_options.CONNECTOR_POOL_SIZE,
+    config_options.CONNECTOR_HOST_CONCURRENCY,
+    config_options.CONNECTOR_DNS_TTL,
+    config_options.CONNECTOR_TIMEOUT,
+)
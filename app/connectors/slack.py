@@ -1,13 +1,13 @@
 import re
-from typing import Any, Coroutine, TypeAlias
-import asyncio
+from typing import Any, TypeAlias
 
 from slack_sdk.webhook.async_client import AsyncWebhookClient
-from slack_sdk.http_retry.builtin_async_handlers import AsyncRateLimitErrorRetryHandler
 
 from modules.objects import BaseArticle
 from app import config_options
 
+from .runtime import connector_runtime
+
 BlockMsg: TypeAlias = dict[str, Any]
 
 url_pattern = re.compile(
@@ -66,46 +66,41 @@ def format(articles: list[BaseArticle], feed_name: str) -> list[list[BlockMsg]]:
     return [create_blocks(article) for article in articles]
 
 
-async def send_messages(urls: list[str], message_batches: list[list[BlockMsg]]) -> None:
-    send_actions: list[Coroutine[Any, Any, None]] = []
-    rate_limit_handler = AsyncRateLimitErrorRetryHandler(max_retry_count=10)
-
-    async def send(url: str, blocks: list[BlockMsg]) -> None:
-        webhook = AsyncWebhookClient(url)
-        webhook.retry_handlers.append(rate_limit_handler)
-
-        r = await webhook.send(blocks=blocks)
-
-        if r.status_code == 400 and "invalid_blocks" in r.body:
-            for block in blocks:
-                if "type" in block and block["type"] == "image":
-                    block["image_url"] = config_options.FULL_LOGO_URL
+def payloads(message_batches: list[list[BlockMsg]]) -> list[dict[str, Any]]:
+    return [{"blocks": blocks} for blocks in message_batches]
 
-            for _ in range(3):
-                r = await webhook.send(blocks=blocks)
-                if r.status_code != 400:
-                    break
 
-    for url in urls:
-        for messages in message_batches:
-            send_actions.append(send(url, messages))
+def repair(payload: dict[str, Any], error: str) -> dict[str, Any] | None:
+    """Replaces the article images with the logo, as Slack rejects unreachable images"""
+    if "invalid_blocks" not in error:
+        return None
 
-    await asyncio.gather(*send_actions, return_exceptions=True)
+    return {
+        "blocks": [
+            (
+                {**block, "image_url": config_options.FULL_LOGO_URL}
+                if block.get("type") == "image"
+                else block
+            )
+            for block in payload["blocks"]
+        ]
+    }
 
 
 async def validate(url: str) -> bool:
     if url_pattern.fullmatch(url) is None:
         return False
 
-    webhook = AsyncWebhookClient(url)
-
-    r = await webhook.send(text="Initializing webhook from OSINTer...")
+    webhook = AsyncWebhookClient(url, session=connector_runtime.session)
 
-    for _ in range(3):
-        if r.status_code == 200:
-            break
+    async with connector_runtime.limit(url):
         r = await webhook.send(text="Initializing webhook from OSINTer...")
 
+        for _ in range(3):
+            if r.status_code == 200:
+                break
+            r = await webhook.send(text="Initializing webhook from OSINTer...")
+
     if r.status_code == 200:
         return True
     else:
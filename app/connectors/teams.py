@@ -1,11 +1,11 @@
-from typing import Any, Coroutine, TypedDict
-import aiohttp
-import asyncio
+from typing import Any, TypedDict
 import re
 
 from modules.objects.articles import BaseArticle
 from app import config_options
 
+from .runtime import connector_runtime
+
 
 AdaptiveCardContent = TypedDict(
     "AdaptiveCardContent",
@@ -99,29 +99,12 @@ def format(articles: list[BaseArticle], feed_name: str) -> list[AdaptiveCard]:
     ]
 
 
-async def send_messages(urls: list[str], messages: list[AdaptiveCard]) -> None:
-    send_actions: list[Coroutine[Any, Any, None]] = []
-
-    async def send(
-        url: str,
-        messages: list[AdaptiveCard],
-        session: aiohttp.ClientSession,
-        attempt: int = 1,
-        max_attempts: int = 3,
-    ) -> None:
-        if attempt > max_attempts:
-            return
-
-        message = {"type": "message", "attachments": messages}
-        async with session.post(url, json=message) as response:
-            if not response.ok:
-                await send(url, messages, session, attempt + 1)
+def payloads(messages: list[AdaptiveCard]) -> list[dict[str, Any]]:
+    return [{"type": "message", "attachments": messages}]
 
-    async with aiohttp.ClientSession() as session:
-        for url in urls:
-            send_actions.append(send(url, messages, session))
 
-        await asyncio.gather(*send_actions, return_exceptions=True)
+def repair(payload: dict[str, Any], error: str) -> dict[str, Any] | None:
+    return None
 
 
 async def validate(url: str) -> bool:
@@ -151,10 +134,10 @@ async def validate(url: str) -> bool:
         ],
     }
 
-    async with aiohttp.ClientSession() as session:
+    async with connector_runtime.limit(url):
         for _ in range(3):
-            r = await session.post(url, json=init_message)
-            if r.ok:
-                return True
+            async with connector_runtime.session.post(url, json=init_message) as r:
+                if r.ok:
+                    return True
 
     return False
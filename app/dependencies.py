@@ -1,13 +1,18 @@
-from typing import Annotated, Literal, Self, Set, TypeAlias
+from typing import Annotated, Any, Literal, Self, Set, TypeAlias
 from uuid import UUID
-from fastapi import Body, Depends, Query
+from fastapi import Body, Depends, HTTPException, Query, Response
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_422_UNPROCESSABLE_ENTITY
 from datetime import datetime
 
 from app.users.auth.authorization import expire_premium
 from app.users.auth.dependencies import get_source_exclusions
-from app.users import models
-from app.users.crud import get_item
+from app.users.crud import get_user, get_user_from_api_key
 from app.users.schemas import Collection, FeedCreate, User
+from app.utils.elastic import (
+    Completeness,
+    CursorMismatchError,
+    es_article_async_client,
+)
 
 from modules.elastic import ArticleSearchQuery, CVESearchQuery, ClusterSearchQuery
 
@@ -177,6 +182,53 @@ class FastapiCVESearchQuery(CVESearchQuery):
         )
 
 
+class ArticlePagination:
+    """
+    Opt-in cursor based pagination for article listings. When either a cursor or a
+    page size is given, a single page is returned and the cursor for the next one
+    is sent in the X-Next-Cursor header. Cursors are only accepted along with the
+    query they were created for
+    """
+
+    def __init__(
+        self,
+        response: Response,
+        cursor: Annotated[str | None, Query()] = None,
+        page_size: Annotated[int | None, Query(gt=0, le=10_000)] = None,
+    ):
+        self.response = response
+        self.cursor = cursor
+        self.page_size = page_size
+
+    async def query_articles(
+        self, query: ArticleSearchQuery, completeness: Completeness
+    ) -> list[Any]:
+        if not self.cursor and not self.page_size:
+            result = await es_article_async_client.query_documents(query, completeness)
+            return result[0]
+
+        if self.page_size:
+            page_size = self.page_size
+        elif 0 < query.limit <= 10_000:
+            page_size = query.limit
+        else:
+            page_size = 100
+
+        try:
+            articles, next_cursor = await es_article_async_client.query_page(
+                query, completeness, page_size, self.cursor
+            )
+        except CursorMismatchError as e:
+            raise HTTPException(HTTP_400_BAD_REQUEST, str(e))
+        except ValueError as e:
+            raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, str(e))
+
+        if next_cursor:
+            self.response.headers["X-Next-Cursor"] = next_cursor
+
+        return articles
+
+
 class UserCache:
     def __init__(self) -> None:
         self.user: None | User = None
@@ -185,8 +237,8 @@ class UserCache:
         if isinstance(self.user, User):
             return self.user
 
-        user = get_item(id, "user")
-        if isinstance(user, int):
+        user = get_user(id)
+        if not user:
             return None
 
         user = expire_premium(user)
@@ -198,8 +250,8 @@ class UserCache:
         if self.user:
             return self.user
 
-        user = get_item(key, "user", models.User.by_api_key)
-        if isinstance(user, int):
+        user = get_user_from_api_key(key)
+        if not user:
             return None
 
         user = expire_premium(user)
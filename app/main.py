@@ -3,7 +3,14 @@ from urllib.parse import parse_qsl, urlencode
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
 
+from app.connectors.runtime import connector_runtime
 from app.dependencies import UserCache
+from app.secrets import HashQueueFull
+from app.users.cache import user_cache
+from app.utils.couch import couch_async_conn
+from app.utils.elastic import es_async_conn
+from app.utils.pdf_jobs import shutdown_pool, start_cleanup
+from app.utils.reads import read_tracker
 
 from .routers import router as root_router
 from .routers import auth, ml
@@ -41,6 +48,27 @@ async def attach_user_obj(request: Request, call_next: Callable[..., Any]) -> An
     return await call_next(request)
 
 
+@app.on_event("startup")
+async def start_background_tasks() -> None:
+    user_cache.start()
+    read_tracker.start()
+    start_cleanup()
+
+
+@app.on_event("shutdown")
+async def close_connections() -> None:
+    await read_tracker.stop()
+    await es_async_conn.close()
+    await couch_async_conn.close()
+    await connector_runtime.close()
+    shutdown_pool()
+
+
+@app.exception_handler(HashQueueFull)
+async def hash_queue_full_handler(_: Any, e: HashQueueFull) -> JSONResponse:
+    return JSONResponse({"detail": str(e)}, 503, headers={"Retry-After": "1"})
+
+
 @app.exception_handler(Exception)
 async def custom_internal_error_handler(_: Any, __: Any) -> JSONResponse:
     return JSONResponse({"detail": "Internal server error"}, 500)
@@ -2,6 +2,8 @@ from typing import Literal, TypedDict
 from fastapi import APIRouter
 
 from app import config_options
+from config import CouchPoolStats
+from app.users.auth.throttle import ThrottleStats, login_throttle
 from app.users.auth.common import (
     Area,
     Level,
@@ -41,3 +43,16 @@ def get_applications_stats() -> Stats:
         },
         "auth": {"allowed_areas": levels_access, "webhook_limits": webhook_limits},
     }
+
+
+class Health(TypedDict):
+    couchdb_pool: CouchPoolStats
+    login_throttle: ThrottleStats
+
+
+@router.get("/health")
+def get_health() -> Health:
+    return {
+        "couchdb_pool": config_options.couch_pool.stats(),
+        "login_throttle": login_throttle.stats(),
+    }
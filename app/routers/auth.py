@@ -6,12 +6,12 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Response, status
 from fastapi.security import OAuth2PasswordRequestForm
 from starlette.status import HTTP_401_UNAUTHORIZED, HTTP_422_UNPROCESSABLE_ENTITY
-from app.users import schemas
+from app.users import async_crud, schemas
 
+from app.users.auth.throttle import throttle_login
 from app.users.auth.token import create_access_token
 
 from app.users.auth import ensure_user_from_request
-from app.users.crud import check_username, create_user, verify_user
 from app.users.schemas import User
 
 from .. import config_options
@@ -53,7 +53,7 @@ async def send_password_recovery_mail(
     username: str, email: str, mail_available: bool = Depends(check_mail_available)
 ) -> DefaultResponse:
     if mail_available:
-        current_user = schemas.User.model_validate(check_username(username=username))
+        current_user = await async_crud.check_username(username=username)
 
         if not current_user:
             raise HTTPException(
@@ -62,7 +62,9 @@ async def send_password_recovery_mail(
                 headers={"WWW-Authenticate": "Bearer"},
             )
         else:
-            if verify_user(current_user.id, username=username, email=email):
+            if await async_crud.verify_user(
+                current_user.id, username=username, email=email
+            ):
                 # This needs to send the recovery email, once implemented
                 raise NotImplemented
 
@@ -83,7 +85,7 @@ async def send_password_recovery_mail(
 async def get_auth_status(
     current_user: User = Depends(ensure_user_from_request),
 ) -> User:
-    return current_user
+    return await async_crud.with_read_articles(current_user)
 
 
 @router.post("/logout")
@@ -101,17 +103,22 @@ class TokenWithDetails(TypedDict):
     secure: bool
 
 
-def get_token_from_form(
-    form_data: OAuth2PasswordRequestForm = Depends(), remember_me: bool = False
+async def get_token_from_form(
+    form_data: OAuth2PasswordRequestForm = Depends(),
+    remember_me: bool = False,
+    # Rejects throttled attempts before the user is looked up or anything is hashed
+    _: None = Depends(throttle_login),
 ) -> TokenWithDetails:
-    user = check_username(form_data.username)
+    user = await async_crud.check_username(form_data.username)
 
     if not user:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED, detail="User wasn't found"
         )
 
-    if not verify_user(user.id, user, form_data.username, form_data.password):
+    if not await async_crud.verify_user(
+        user.id, user, form_data.username, form_data.password
+    ):
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED, detail="Wrong username or password"
         )
@@ -215,7 +222,7 @@ async def signup(
             status=True, expire_time=int(diff.timestamp())
         )
 
-    if create_user(
+    if await async_crud.create_user(
         username=form_data.username,
         password=form_data.password,
         email=form_data.email,
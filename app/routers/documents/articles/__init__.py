@@ -1,9 +1,9 @@
+from collections.abc import AsyncIterator
 from datetime import date
-from io import BytesIO
-from typing import Annotated, Any
+from typing import Annotated, Any, cast
 
-from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, status
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import Response
 from pathvalidate import sanitize_filename
 
 from app.users.auth.dependencies import (
@@ -14,20 +14,21 @@ from app.users.auth.dependencies import (
 from app.users.auth import (
     get_user_from_request,
 )
-from app.users.crud import modify_collection, update_user
 from app.users.schemas import User
 from app.utils.profiles import ProfileDetails, collect_profile_details
 
 from modules.files import article_to_md
 from modules.objects import BaseArticle, FullArticle
 
-from .... import config_options
 from ....common import EsID, HTTPError
 from ....dependencies import (
+    ArticlePagination,
     FastapiArticleSearchQuery,
     SourceExclusions,
 )
 from ....utils.documents import convert_article_query_to_zip, send_file
+from ....utils.elastic import es_article_async_client
+from ....utils.reads import read_tracker
 from .rss import router as rss_router
 
 ArticleAuthorizer = UserAuthorizer(["articles"])
@@ -38,20 +39,23 @@ router.include_router(rss_router, tags=["rss"])
 
 @router.get("/newest")
 async def get_newest_articles(source_exclusions: SourceExclusions) -> list[BaseArticle]:
-    return config_options.es_article_client.query_documents(
-        FastapiArticleSearchQuery(
-            source_exclusions, limit=50, sort_by="publish_date", sort_order="desc"
-        ),
-        False,
+    return (
+        await es_article_async_client.query_documents(
+            FastapiArticleSearchQuery(
+                source_exclusions, limit=50, sort_by="publish_date", sort_order="desc"
+            ),
+            False,
+        )
     )[0]
 
 
 @router.post("/search", response_model_exclude_unset=True)
 async def search_articles(
+    pagination: Annotated[ArticlePagination, Depends(ArticlePagination)],
     query: FastapiArticleSearchQuery = Depends(FastapiArticleSearchQuery),
     complete: bool = Query(False),
 ) -> list[BaseArticle] | list[FullArticle]:
-    articles = config_options.es_article_client.query_documents(query, complete)[0]
+    articles = await pagination.query_articles(query, complete)
     return articles
 
 
@@ -66,8 +70,8 @@ async def search_articles(
     },
 )
 def download_multiple_markdown_files_using_search(
-    zip_file: BytesIO = Depends(convert_article_query_to_zip),
-) -> StreamingResponse:
+    zip_file: AsyncIterator[bytes] = Depends(convert_article_query_to_zip),
+) -> Response:
     return send_file(
         file_name=f"OSINTer-MD-articles-{date.today()}-Search-Download.zip",
         file_content=zip_file,
@@ -88,11 +92,14 @@ articleNotFound: dict[str | int, dict[str, Any]] = {
 }
 
 
-def get_single_article(id: EsID, source_exclusions: SourceExclusions) -> FullArticle:
+async def get_single_article(
+    id: EsID, source_exclusions: SourceExclusions
+) -> FullArticle:
     try:
-        return config_options.es_article_client.query_documents(
+        articles = await es_article_async_client.query_documents(
             FastapiArticleSearchQuery(source_exclusions, limit=1, ids={id}), True
-        )[0][0]
+        )
+        return cast(FullArticle, articles[0][0])
     except IndexError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Article not found"
@@ -100,9 +107,9 @@ def get_single_article(id: EsID, source_exclusions: SourceExclusions) -> FullArt
 
 
 @router.get("/{id}/export", tags=["download"], responses=articleNotFound)
-def download_single_markdown_file(
+async def download_single_markdown_file(
     article: FullArticle = Depends(get_single_article),
-) -> StreamingResponse:
+) -> Response:
     article_file = article_to_md(article)
 
     return send_file(
@@ -112,14 +119,6 @@ def download_single_markdown_file(
     )
 
 
-def mark_as_read(article: FullArticle, user: User | None) -> None:
-    config_options.es_article_client.increment_read_counter(article.id)
-    if user:
-        user.read_articles = [id for id in user.read_articles if id != article.id]
-        user.read_articles.insert(0, article.id)
-        update_user(user)
-
-
 @router.get(
     "/{id}/content",
     responses={
@@ -130,14 +129,13 @@ def mark_as_read(article: FullArticle, user: User | None) -> None:
     },
 )
 async def get_article_content(
-    background_tasks: BackgroundTasks,
     id: EsID,
     user: User | None = Depends(get_user_from_request),
 ) -> FullArticle:
     source_exclusions = get_source_exclusions(get_allowed_areas(user))
-    article = get_single_article(id, source_exclusions)
+    article = await get_single_article(id, source_exclusions)
 
-    background_tasks.add_task(mark_as_read, article, user)
+    read_tracker.record(article.id, user.id if user else None)
 
     return article
 
@@ -147,16 +145,18 @@ async def get_similar_articles(
     id: EsID, user: Annotated[User, Depends(UserAuthorizer(["similar"]))]
 ) -> list[BaseArticle]:
     source_exclusions = get_source_exclusions(get_allowed_areas(user))
-    article = get_single_article(id, source_exclusions)
+    article = await get_single_article(id, source_exclusions)
 
     if len(article.similar) == 0:
         return []
 
-    articles = config_options.es_article_client.query_documents(
-        FastapiArticleSearchQuery(
-            source_exclusions, limit=10_000, ids=set(article.similar)
-        ),
-        False,
+    articles = (
+        await es_article_async_client.query_documents(
+            FastapiArticleSearchQuery(
+                source_exclusions, limit=10_000, ids=set(article.similar)
+            ),
+            False,
+        )
     )[0]
 
     # The similar articles id list is sorted so that the closest is the first
@@ -1,9 +1,10 @@
 from fastapi import APIRouter, Depends, Query, Request, Response
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 
-from app import config_options
 from app.users.auth.dependencies import UserAuthorizer
 from app.dependencies import FastapiArticleSearchQuery, SourceExclusions
+from app.utils.elastic import es_article_async_client
 from app.utils.rss import generate_rss_feed
 
 ArticleAuthorizer = UserAuthorizer(["articles"])
@@ -18,21 +19,26 @@ class XMLResponse(Response):
 
 
 @router.get("/newest/rss")
-def get_newest_rss(
+async def get_newest_rss(
     request: Request,
     source_exclusions: SourceExclusions,
     original_url: bool = Query(False),
     limit: int = Query(50),
 ) -> Response:
-    articles = config_options.es_article_client.query_documents(
-        FastapiArticleSearchQuery(
-            source_exclusions, limit=limit, sort_by="publish_date", sort_order="desc"
-        ),
-        True,
+    articles = (
+        await es_article_async_client.query_documents(
+            FastapiArticleSearchQuery(
+                source_exclusions, limit=limit, sort_by="publish_date", sort_order="desc"
+            ),
+            True,
+        )
     )[0]
 
+    # Collecting the profile details queries Elasticsearch synchronously
+    feed = await run_in_threadpool(generate_rss_feed, articles, original_url)
+
     return jinja_templates.TemplateResponse(
         "rssv2.j2",
-        {"request": request, "feed": generate_rss_feed(articles, original_url)},
+        {"request": request, "feed": feed},
         headers={"content-type": "application/xml"},
     )
@@ -1,17 +1,32 @@
+from collections.abc import AsyncIterator
 from datetime import date
-from io import BytesIO
-from typing import Annotated
+import os
+import pathlib
+from typing import Annotated, cast
 from typing_extensions import TypedDict
 from fastapi import APIRouter, Depends, HTTPException, Path, Query
-from fastapi.responses import StreamingResponse
-from starlette.status import HTTP_404_NOT_FOUND
+from fastapi.responses import Response
+from starlette.status import HTTP_404_NOT_FOUND, HTTP_500_INTERNAL_SERVER_ERROR
 
-from app import config_options
 from app.users.auth.dependencies import UserAuthorizer, get_source_exclusions
 from app.common import HTTPError
-from app.dependencies import FastapiArticleSearchQuery, FastapiCVESearchQuery
+from app.dependencies import (
+    ArticlePagination,
+    FastapiArticleSearchQuery,
+    FastapiCVESearchQuery,
+)
 from app.utils.documents import convert_article_query_to_zip, send_file
-from app.utils.pdf import MarkdownPdf
+from app.utils.elastic import es_article_async_client, es_cve_async_client
+from app.utils.pdf_jobs import (
+    PdfJob,
+    allow_access,
+    get_job_id,
+    get_job_path,
+    get_job_status,
+    has_access,
+    submit_job,
+    wait_for_job,
+)
 from modules.elastic import ArticleSearchQuery, CVESearchQuery
 from modules.objects.articles import BaseArticle, FullArticle
 from modules.objects.cves import BaseCVE, FullCVE
@@ -34,9 +49,13 @@ class CVEOverview(TypedDict):
 
 
 @router.get("/overview")
-def get_cve_overviews(cves: Annotated[list[str], Query()]) -> list[CVEOverview]:
-    cves_content = config_options.es_cve_client.query_documents(
-        CVESearchQuery(limit=10000, cves=set(cves)), False
+async def get_cve_overviews(
+    cves: Annotated[list[str], Query()]
+) -> list[CVEOverview]:
+    cves_content: list[BaseCVE] = (
+        await es_cve_async_client.query_documents(
+            CVESearchQuery(limit=10000, cves=set(cves)), False
+        )
     )[0]
 
     cve_overviews: list[CVEOverview] = []
@@ -79,36 +98,38 @@ def get_cve_overviews(cves: Annotated[list[str], Query()]) -> list[CVEOverview]:
         }
     },
 )
-def get_cve_details(
+async def get_cve_details(
     cve_id: CVEPathParam, complete: Annotated[bool, Query()] = False
 ) -> BaseCVE | FullCVE:
     try:
-        cve = config_options.es_cve_client.query_documents(
+        cves = await es_cve_async_client.query_documents(
             CVESearchQuery(limit=1, cves={cve_id.upper()}), complete
-        )[0][0]
-        return cve
+        )
+        return cast(BaseCVE | FullCVE, cves[0][0])
     except IndexError:
         raise HTTPException(HTTP_404_NOT_FOUND, "CVE was not found")
 
 
 @protected_router.get("/{cve_id}/articles", response_model_exclude_unset=True)
-def get_cve_articles(
-    cve_id: CVEPathParam, complete: Annotated[bool, Query()] = False
+async def get_cve_articles(
+    cve_id: CVEPathParam,
+    pagination: Annotated[ArticlePagination, Depends(ArticlePagination)],
+    complete: Annotated[bool, Query()] = False,
 ) -> list[BaseArticle] | list[FullArticle]:
-    return config_options.es_article_client.query_documents(
+    return await pagination.query_articles(
         ArticleSearchQuery(
             limit=0, cve=cve_id, sort_by="publish_date", sort_order="desc"
         ),
         complete,
-    )[0]
+    )
 
 
 @protected_router.post("/search", response_model_by_alias=False)
-def search_cves(
+async def search_cves(
     query: Annotated[FastapiCVESearchQuery, Depends(FastapiCVESearchQuery)],
     complete: bool = False,
 ) -> list[BaseCVE] | list[FullCVE]:
-    return config_options.es_cve_client.query_documents(query, complete)[0]
+    return (await es_cve_async_client.query_documents(query, complete))[0]
 
 
 @protected_router.get(
@@ -124,8 +145,8 @@ def search_cves(
 async def download_articles_from_cve_as_md(
     source_exclusions: Annotated[list[str], Depends(get_source_exclusions)],
     cve_id: CVEPathParam,
-) -> StreamingResponse:
-    zip_file: BytesIO = convert_article_query_to_zip(
+) -> Response:
+    zip_file: AsyncIterator[bytes] = await convert_article_query_to_zip(
         FastapiArticleSearchQuery(source_exclusions, limit=0, cve=cve_id)
     )
 
@@ -136,6 +157,60 @@ async def download_articles_from_cve_as_md(
     )
 
 
+async def submit_cve_pdf_job(
+    source_exclusions: Annotated[list[str], Depends(get_source_exclusions)],
+    cve_id: CVEPathParam,
+) -> PdfJob:
+    def article_query() -> FastapiArticleSearchQuery:
+        return FastapiArticleSearchQuery(
+            source_exclusions,
+            limit=0,
+            cve=cve_id,
+            sort_by="publish_date",
+            sort_order="desc",
+        )
+
+    article_ids: list[BaseArticle] = (
+        await es_article_async_client.query_documents(article_query(), False)
+    )[0]
+
+    if len(article_ids) < 1:
+        raise HTTPException(HTTP_404_NOT_FOUND, f"No articles found for {cve_id}")
+
+    job_id = get_job_id(cve_id, article_ids, source_exclusions)
+    allow_access(job_id, source_exclusions)
+    status = get_job_status(job_id)
+
+    if status == "done" or status == "pending":
+        return {"id": job_id, "status": status}
+
+    articles: list[FullArticle] = (
+        await es_article_async_client.query_documents(article_query(), True)
+    )[0]
+
+    return submit_job(job_id, f"{cve_id} | OSINTer", articles)
+
+
+def get_cve_pdf_job_path(
+    source_exclusions: Annotated[list[str], Depends(get_source_exclusions)],
+    cve_id: CVEPathParam,
+    job_id: str,
+) -> str:
+    if not job_id.startswith(f"{cve_id.upper()}-"):
+        raise HTTPException(HTTP_404_NOT_FOUND, "PDF job was not found")
+
+    try:
+        path = get_job_path(job_id)
+    except ValueError:
+        raise HTTPException(HTTP_404_NOT_FOUND, "PDF job was not found")
+
+    # Jobs rendered with sources the user can't see are hidden from them
+    if not has_access(job_id, source_exclusions):
+        raise HTTPException(HTTP_404_NOT_FOUND, "PDF job was not found")
+
+    return path
+
+
 @protected_router.get(
     "/{cve_id}/export/pdf",
     tags=["download"],
@@ -147,32 +222,78 @@ async def download_articles_from_cve_as_md(
     },
 )
 async def download_articles_from_cve_as_pdf(
-    source_exclusions: Annotated[list[str], Depends(get_source_exclusions)],
     cve_id: CVEPathParam,
-) -> StreamingResponse:
+    job: Annotated[PdfJob, Depends(submit_cve_pdf_job)],
+) -> Response:
+    if await wait_for_job(job["id"]) != "done":
+        raise HTTPException(
+            HTTP_500_INTERNAL_SERVER_ERROR, f"Error when generating PDF for {cve_id}"
+        )
 
-    articles = config_options.es_article_client.query_documents(
-        FastapiArticleSearchQuery(
-            source_exclusions,
-            limit=0,
-            cve=cve_id,
-            sort_by="publish_date",
-            sort_order="desc",
-        ),
-        True,
-    )[0]
+    return send_file(
+        file_name=f"{cve_id}-OSINTer-{date.today()}.pdf",
+        file_content=pathlib.Path(get_job_path(job["id"])),
+        file_type="application/pdf",
+    )
 
-    if len(articles) < 1:
-        raise HTTPException(HTTP_404_NOT_FOUND, f"No articles found for {cve_id}")
 
-    PDFCreator = MarkdownPdf(f"{cve_id} | OSINTer")
+@protected_router.post(
+    "/{cve_id}/export/pdf/jobs",
+    tags=["download"],
+    responses={
+        404: {
+            "model": HTTPError,
+            "description": "Returned when no articles are found for the CVE",
+        }
+    },
+)
+async def create_cve_pdf_job(
+    job: Annotated[PdfJob, Depends(submit_cve_pdf_job)]
+) -> PdfJob:
+    return job
 
-    for article in articles:
-        PDFCreator.add_article(article)
+
+@protected_router.get(
+    "/{cve_id}/export/pdf/jobs/{job_id}",
+    tags=["download"],
+    responses={
+        404: {
+            "model": HTTPError,
+            "description": "Returned when the job isn't found",
+        }
+    },
+)
+async def get_cve_pdf_job(
+    job_id: str, _: Annotated[str, Depends(get_cve_pdf_job_path)]
+) -> PdfJob:
+    status = get_job_status(job_id)
+
+    if not status:
+        raise HTTPException(HTTP_404_NOT_FOUND, "PDF job was not found")
+
+    return {"id": job_id, "status": status}
+
+
+@protected_router.get(
+    "/{cve_id}/export/pdf/jobs/{job_id}/download",
+    tags=["download"],
+    responses={
+        404: {
+            "model": HTTPError,
+            "description": "Returned when the job isn't found or hasn't finished",
+        }
+    },
+)
+async def download_cve_pdf_job(
+    cve_id: CVEPathParam,
+    job_path: Annotated[str, Depends(get_cve_pdf_job_path)],
+) -> Response:
+    if not os.path.isfile(job_path):
+        raise HTTPException(HTTP_404_NOT_FOUND, "PDF job hasn't finished")
 
     return send_file(
         file_name=f"{cve_id}-OSINTer-{date.today()}.pdf",
-        file_content=PDFCreator.save(),
+        file_content=pathlib.Path(job_path),
         file_type="application/pdf",
     )
 
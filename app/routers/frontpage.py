@@ -1,4 +1,3 @@
-from concurrent import futures
 from datetime import UTC, datetime, timedelta
 from typing import Annotated, Any, Sequence, TypedDict, cast
 from fastapi import APIRouter, HTTPException, Path
@@ -14,6 +13,15 @@ from modules.elastic import (
 from modules.elastic.queries import CVESearchQuery, ClusterSearchQuery
 from modules.objects import BaseCVE, BaseCluster, AbstractArticle, BaseArticle
 
+from ..utils.cache import FileCache
+from ..utils.elastic import (
+    MultiSearch,
+    article_models,
+    cluster_models,
+    cve_models,
+    es_article_async_client,
+)
+
 router = APIRouter()
 
 
@@ -44,38 +52,9 @@ class FrontpageData(TypedDict):
 CVEPathParam = Annotated[str, Path(pattern="^[Cc][Vv][Ee]-\\d{4}-\\d{4,7}$")]
 
 
-@router.get("", response_model_by_alias=False)
-def get_front_page_metrics() -> FrontpageData:
+def query_front_page_metrics() -> FrontpageData:
     first_date = datetime.now(UTC) - timedelta(days=30)
 
-    def get_articles(buckets: list[SignificantTermAggBucket]) -> list[TrendingArticles]:
-        def get_articles_from_bucket(
-            bucket: SignificantTermAggBucket,
-        ) -> TrendingArticles:
-            articles = config_options.es_article_client.query_documents(
-                ArticleSearchQuery(
-                    limit=6,
-                    sort_by="",
-                    sort_order="desc",
-                    search_term=bucket["key"],
-                    first_date=first_date,
-                    highlight=True,
-                ),
-                ["title", "url", "image_url"],
-            )[0]
-
-            return {
-                "tag": bucket["key"],
-                "count": bucket["bg_count"] + bucket["doc_count"],
-                "articles": cast(list[PartialTrendingArticle], articles),
-            }
-
-        with futures.ThreadPoolExecutor() as executor:
-            article_futures = [
-                executor.submit(get_articles_from_bucket, bucket) for bucket in buckets
-            ]
-            return [result.result() for result in futures.as_completed(article_futures)]
-
     def get_index(l: list[Any], el: Any) -> int:
         try:
             return l.index(el)
@@ -121,23 +100,49 @@ def get_front_page_metrics() -> FrontpageData:
 
     cve_ids = [bucket["key"] for bucket in metrics["cves"]["buckets"]]
     cluster_ids = [bucket["key"] for bucket in metrics["clusters"]["buckets"]]
-
-    with futures.ThreadPoolExecutor() as executor:
-        article_futures = executor.submit(get_articles, metrics["new_tags"]["buckets"])
-        cve_futures = executor.submit(
-            config_options.es_cve_client.query_documents,
-            CVESearchQuery(cves=set(cve_ids)),
-            False,
-        )
-        cluster_futures = executor.submit(
-            config_options.es_cluster_client.query_documents,
-            ClusterSearchQuery(ids=set(cluster_ids)),
-            False,
+    tag_buckets: list[SignificantTermAggBucket] = metrics["new_tags"]["buckets"]
+
+    # Trending articles, CVEs and clusters are all fetched in a single round-trip
+    search = MultiSearch(config_options.es_article_client.es)
+
+    for bucket in tag_buckets:
+        search.add(
+            config_options.es_article_client,
+            ArticleSearchQuery(
+                limit=6,
+                sort_by="",
+                sort_order="desc",
+                search_term=bucket["key"],
+                first_date=first_date,
+                highlight=True,
+            ),
+            article_models,
+            ["title", "url", "image_url"],
         )
 
-        trending_articles = article_futures.result()
-        trending_cves = cve_futures.result()[0]
-        trending_clusters = cluster_futures.result()[0]
+    search.add(
+        config_options.es_cve_client,
+        CVESearchQuery(limit=len(cve_ids), cves=set(cve_ids)),
+        cve_models,
+    )
+    search.add(
+        config_options.es_cluster_client,
+        ClusterSearchQuery(limit=len(cluster_ids), ids=set(cluster_ids)),
+        cluster_models,
+    )
+
+    *article_results, cve_results, cluster_results = search.execute()
+
+    trending_articles: list[TrendingArticles] = [
+        {
+            "tag": bucket["key"],
+            "count": bucket["bg_count"] + bucket["doc_count"],
+            "articles": cast(list[PartialTrendingArticle], articles),
+        }
+        for bucket, articles in zip(tag_buckets, article_results)
+    ]
+    trending_cves = cast(list[BaseCVE], cve_results)
+    trending_clusters = cast(list[BaseCluster], cluster_results)
 
     trending_cves.sort(key=lambda cve: get_index(cve_ids, cve.cve))
     trending_clusters.sort(key=lambda cluster: get_index(cluster_ids, cluster.id))
@@ -149,8 +154,21 @@ def get_front_page_metrics() -> FrontpageData:
     }
 
 
+frontpage_cache: FileCache[FrontpageData] = FileCache(
+    "frontpage",
+    ttl=config_options.FRONTPAGE_CACHE_TTL,
+    stale_ttl=config_options.FRONTPAGE_CACHE_STALE_TTL,
+    cache_dir=config_options.CACHE_DIR,
+)
+
+
+@router.get("", response_model_by_alias=False)
+def get_front_page_metrics() -> FrontpageData:
+    return frontpage_cache.get(query_front_page_metrics)
+
+
 @router.get("/cve-articles/{cve_id}")
-def get_fron_page_articles_for_cves(cve_id: CVEPathParam) -> list[BaseArticle]:
+async def get_fron_page_articles_for_cves(cve_id: CVEPathParam) -> list[BaseArticle]:
     first_date = datetime.now(UTC) - timedelta(days=30)
 
     cve_q = ArticleSearchQuery(
@@ -167,7 +185,7 @@ def get_fron_page_articles_for_cves(cve_id: CVEPathParam) -> list[BaseArticle]:
         },
     )
 
-    cve_metrics = config_options.es_article_client.query_documents(cve_q, False)[2]
+    cve_metrics = (await es_article_async_client.query_documents(cve_q, False))[2]
 
     if not cve_metrics:
         raise HTTPException(
@@ -180,7 +198,7 @@ def get_fron_page_articles_for_cves(cve_id: CVEPathParam) -> list[BaseArticle]:
 
     if cve_id.lower() in cve_ids:
         q = ArticleSearchQuery(sort_by="", sort_order="desc", cve=cve_id)
-        return config_options.es_article_client.query_documents(q, False)[0]
+        return (await es_article_async_client.query_documents(q, False))[0]
     else:
         raise HTTPException(
             HTTP_403_FORBIDDEN, detail=f"{cve_id} is not available for frontpage access"
@@ -1,9 +1,9 @@
+from collections.abc import AsyncIterator
 from datetime import date
-from io import BytesIO
-from typing import Annotated, TypeAlias, Union
+from typing import Annotated, TypeAlias, Union, cast
 
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 
 from modules.elastic import ClusterSearchQuery
 from modules.objects import (
@@ -13,9 +13,9 @@ from modules.objects import (
     FullCluster,
 )
 
-from ... import config_options
 from ...common import EsID, HTTPError
 from ...utils.documents import convert_article_query_to_zip, send_file
+from ...utils.elastic import es_article_async_client, es_cluster_async_client
 from app.dependencies import FastapiArticleSearchQuery, FastapiClusterSearchQuery
 from app.users.auth.dependencies import UserAuthorizer, get_source_exclusions
 
@@ -25,18 +25,20 @@ router = APIRouter(dependencies=[Depends(ClusterAuthorizer)])
 ClusterID: TypeAlias = Union[int, EsID]
 
 
-def query_cluster(cluster_id: ClusterID) -> FullCluster:
+async def query_cluster(cluster_id: ClusterID) -> FullCluster:
     try:
         if isinstance(cluster_id, int):
-            return config_options.es_cluster_client.query_documents(
+            clusters = await es_cluster_async_client.query_documents(
                 ClusterSearchQuery(cluster_nr=cluster_id), True
-            )[0][0]
+            )
         elif isinstance(cluster_id, str):
-            return config_options.es_cluster_client.query_documents(
+            clusters = await es_cluster_async_client.query_documents(
                 ClusterSearchQuery(ids={cluster_id}), True
-            )[0][0]
+            )
         else:
             raise NotImplemented
+
+        return cast(FullCluster, clusters[0][0])
     except IndexError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Cluster not found"
@@ -47,11 +49,13 @@ def query_cluster(cluster_id: ClusterID) -> FullCluster:
     "/clusters",
     response_model_exclude_unset=True,
 )
-def get_article_clusters(
+async def get_article_clusters(
     complete: bool = Query(False),
 ) -> list[BaseCluster] | list[FullCluster]:
-    return config_options.es_cluster_client.query_documents(
-        ClusterSearchQuery(limit=10000, sort_by="document_count"), complete
+    return (
+        await es_cluster_async_client.query_documents(
+            ClusterSearchQuery(limit=10000, sort_by="document_count"), complete
+        )
     )[0]
 
 
@@ -64,7 +68,7 @@ def get_article_clusters(
         }
     },
 )
-def get_cluster(cluster: FullCluster = Depends(query_cluster)) -> FullCluster:
+async def get_cluster(cluster: FullCluster = Depends(query_cluster)) -> FullCluster:
     return cluster
 
 
@@ -78,16 +82,21 @@ def get_cluster(cluster: FullCluster = Depends(query_cluster)) -> FullCluster:
         }
     },
 )
-def get_articles_from_cluster(
+async def get_articles_from_cluster(
     source_exclusions: Annotated[list[str], Depends(get_source_exclusions)],
     cluster: FullCluster = Depends(query_cluster),
     complete: bool = Query(True),
 ) -> list[BaseArticle] | list[FullArticle]:
-    articles_from_cluster = config_options.es_article_client.query_documents(
-        FastapiArticleSearchQuery(
-            source_exclusions, limit=0, ids=cluster.documents, sort_by="publish_date"
-        ),
-        complete,
+    articles_from_cluster = (
+        await es_article_async_client.query_documents(
+            FastapiArticleSearchQuery(
+                source_exclusions,
+                limit=0,
+                ids=cluster.documents,
+                sort_by="publish_date",
+            ),
+            complete,
+        )
     )[0]
 
     if not articles_from_cluster:
@@ -111,8 +120,8 @@ def get_articles_from_cluster(
 async def download_articles_from_cluster(
     source_exclusions: Annotated[list[str], Depends(get_source_exclusions)],
     cluster: FullCluster = Depends(query_cluster),
-) -> StreamingResponse:
-    zip_file: BytesIO = convert_article_query_to_zip(
+) -> Response:
+    zip_file: AsyncIterator[bytes] = await convert_article_query_to_zip(
         FastapiArticleSearchQuery(source_exclusions, limit=0, cluster_id=cluster.id)
     )
 
@@ -124,8 +133,8 @@ async def download_articles_from_cluster(
 
 
 @router.post("/clusters/search")
-def search_clusters(
+async def search_clusters(
     query: Annotated[FastapiClusterSearchQuery, Depends(FastapiClusterSearchQuery)],
     complete: bool = False,
 ) -> list[BaseCluster] | list[FullCluster]:
-    return config_options.es_cluster_client.query_documents(query, complete)[0]
+    return (await es_cluster_async_client.query_documents(query, complete))[0]
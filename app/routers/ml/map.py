@@ -11,9 +11,8 @@ from modules.objects import (
     PartialArticle,
 )
 
-from ... import config_options
-
 from app.dependencies import FastapiArticleSearchQuery
+from app.utils.elastic import es_article_async_client
 from app.users.auth.dependencies import UserAuthorizer
 
 MapAuthorizer = UserAuthorizer(["map"])
@@ -36,9 +35,11 @@ class PartialMLArticle(AbstractDocument):
     response_model_exclude_none=True,
 )
 async def query_partial_article_map() -> list[PartialArticle]:
-    articles = config_options.es_article_client.query_documents(
-        FastapiArticleSearchQuery([], limit=0),
-        ["title", "description", "source", "profile", "publish_date", "ml"],
+    articles = (
+        await es_article_async_client.query_documents(
+            FastapiArticleSearchQuery([], limit=0),
+            ["title", "description", "source", "profile", "publish_date", "ml"],
+        )
     )[0]
 
     return articles
@@ -46,4 +47,8 @@ async def query_partial_article_map() -> list[PartialArticle]:
 
 @router.get("/full")
 async def query_full_article_map() -> list[FullArticle]:
-    return config_options.es_article_client.query_all_documents()
+    return (
+        await es_article_async_client.query_documents(
+            FastapiArticleSearchQuery([], limit=0), True
+        )
+    )[0]
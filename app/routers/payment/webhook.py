@@ -14,7 +14,7 @@ router = APIRouter()
 
 def get_user_from_stripe_id(id: str) -> schemas.User:
     user_obj: models.User = list(
-        models.User.by_stripe_id(config_options.couch_conn)[id]
+        models.User.by_stripe_id(config_options.couch_conn, include_docs=True)[id]
     )[0]
     return schemas.User.model_validate(user_obj)
 
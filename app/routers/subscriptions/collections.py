@@ -6,34 +6,34 @@ from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
 from app.common import EsIDList
 from app.users.auth import ensure_user_from_request
 
-from ...users import crud, schemas
+from ...users import async_crud, schemas
 
 router = APIRouter()
 
 
 @router.get("/list")
-def get_my_subscribed_collections(
+async def get_my_subscribed_collections(
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> dict[str, schemas.Collection]:
-    return crud.get_collections(current_user)
+    return await async_crud.get_collections(current_user)
 
 
 @router.post(
     "/{collection_name}",
     status_code=status.HTTP_201_CREATED,
 )
-def create_collection(
+async def create_collection(
     collection_name: str,
     ids: EsIDList = Body(set()),
     subscribe: bool = Query(True),
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.Collection:
-    collection: schemas.Collection = crud.create_collection(
+    collection: schemas.Collection = await async_crud.create_collection(
         name=collection_name, owner=current_user.id, ids=cast(set[str], ids)
     )
 
     if subscribe:
-        user_obj: schemas.User | None = crud.modify_user_subscription(
+        user_obj: schemas.User | None = await async_crud.modify_user_subscription(
             user_id=current_user.id,
             ids=[
                 collection.id,
@@ -52,11 +52,11 @@ def create_collection(
 
 
 @router.put("/subscription/{collection_id}", status_code=status.HTTP_204_NO_CONTENT)
-def subscribe_to_collection(
+async def subscribe_to_collection(
     collection_id: UUID,
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> None:
-    crud.modify_user_subscription(
+    await async_crud.modify_user_subscription(
         user_id=current_user.id,
         ids=[collection_id],
         action="subscribe",
@@ -65,11 +65,11 @@ def subscribe_to_collection(
 
 
 @router.delete("/subscription/{collection_id}", status_code=status.HTTP_204_NO_CONTENT)
-def unsubscribe_from_collection(
+async def unsubscribe_from_collection(
     collection_id: UUID,
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> None:
-    crud.modify_user_subscription(
+    await async_crud.modify_user_subscription(
         user_id=current_user.id,
         ids=[collection_id],
         action="unsubscribe",
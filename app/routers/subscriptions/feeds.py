@@ -2,35 +2,37 @@ from uuid import UUID
 from fastapi import APIRouter, Depends, HTTPException, Query, status
 
 from app.users.auth import ensure_user_from_request
+from app.utils.percolator import index_feed_async
 
-from ...users import crud, schemas
+from ...users import async_crud, schemas
 
 router = APIRouter()
 
 
 @router.get("/list")
-def get_my_subscribed_feeds(
+async def get_my_subscribed_feeds(
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> dict[str, schemas.Feed]:
-    return crud.get_feeds(current_user)
+    return await async_crud.get_feeds(current_user)
 
 
 @router.post(
     "/{feed_name}",
     status_code=status.HTTP_201_CREATED,
 )
-def create_feed(
+async def create_feed(
     feed_name: str,
     feed_params: schemas.FeedCreate,
     subscribe: bool = Query(True),
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.Feed:
-    feed: schemas.Feed = crud.create_feed(
+    feed: schemas.Feed = await async_crud.create_feed(
         feed_params=feed_params, name=feed_name, owner=current_user.id
     )
+    await index_feed_async(feed)
 
     if subscribe:
-        user_obj: schemas.User | None = crud.modify_user_subscription(
+        user_obj: schemas.User | None = await async_crud.modify_user_subscription(
             user_id=current_user.id,
             ids=[
                 feed.id,
@@ -49,20 +51,20 @@ def create_feed(
 
 
 @router.put("/subscription/{feed_id}", status_code=status.HTTP_204_NO_CONTENT)
-def subscribe_to_collection(
+async def subscribe_to_collection(
     feed_id: UUID,
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> None:
-    crud.modify_user_subscription(
+    await async_crud.modify_user_subscription(
         user_id=current_user.id, ids=[feed_id], action="subscribe", item_type="feed"
     )
 
 
 @router.delete("/subscription/{feed_id}", status_code=status.HTTP_204_NO_CONTENT)
-def unsubscribe_from_collection(
+async def unsubscribe_from_collection(
     feed_id: UUID,
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> None:
-    crud.modify_user_subscription(
+    await async_crud.modify_user_subscription(
         user_id=current_user.id, ids=[feed_id], action="unsubscribe", item_type="feed"
     )
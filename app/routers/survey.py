@@ -34,7 +34,9 @@ def get_submittet_surveys(
 ) -> list[models.Survey]:
     user_surveys = cast(
         Iterable[models.Survey],
-        models.Survey.by_user_id(config_options.couch_conn)[str(current_user.id)],
+        models.Survey.by_user_id(config_options.couch_conn, include_docs=True)[
+            str(current_user.id)
+        ],
     )
 
     return [survey for survey in user_surveys if survey.version == version]
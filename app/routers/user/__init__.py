@@ -6,15 +6,16 @@ from starlette.status import (
     HTTP_409_CONFLICT,
     HTTP_422_UNPROCESSABLE_ENTITY,
 )
-from app.secrets import generate_api_key, hash_value
-from app.users import schemas
+from app.secrets import generate_api_key, hash_value_async
+from app.users import async_crud, schemas
+from app.users.cache import user_cache
 
 from app.users.auth.common import authentication_exception
 from app.users.auth.dependencies import UserAuthorizer
 from app.users.auth.token import get_id_from_token
 from app.users.auth import ensure_user_from_request
 
-from app.users.crud import check_username, update_user, verify_user
+from app.users.crud import update_user
 from app import config_options
 
 from .payment import router as payment_router
@@ -29,11 +30,11 @@ ApiAuthorizer = UserAuthorizer(["api"])
 async def get_auth_status(
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.User:
-    return current_user
+    return await async_crud.with_read_articles(current_user)
 
 
 @router.post("/credentials")
-def change_credentials(
+async def change_credentials(
     id: UUID | None = Depends(get_id_from_token),
     password: str = Body(...),
     new_username: str | None = Body(None),
@@ -42,49 +43,47 @@ def change_credentials(
 ) -> schemas.User:
     if not id:
         raise authentication_exception
-    user = verify_user(id, password=password)
+    user = await async_crud.verify_user(id, password=password)
     if not user:
         raise authentication_exception
 
-    user_schema = schemas.User.model_validate(user)
-
     if new_username:
-        if check_username(new_username):
+        if await async_crud.check_username(new_username):
             raise HTTPException(
                 status_code=HTTP_409_CONFLICT,
                 detail="Username is already taken",
             )
-        user_schema.username = new_username
+        user.username = new_username
 
     if new_password:
-        user_schema.hashed_password = hash_value(new_password)
+        user.hashed_password = await hash_value_async(new_password)
     if new_email:
-        user_schema.hashed_email = hash_value(new_email)
+        user.hashed_email = await hash_value_async(new_email)
 
-    update_user(user_schema)
+    await async_crud.update_user(user)
 
-    return user_schema
+    return await async_crud.with_read_articles(user)
 
 
 @router.post("/settings")
-def change_settings(
+async def change_settings(
     settings: schemas.PartialUserSettings,
     user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.User:
     user.settings = user.settings.model_copy(
         update=settings.model_dump(exclude_unset=True)
     )
-    update_user(user)
-    return user
+    await async_crud.update_user(user)
+    return await async_crud.with_read_articles(user)
 
 
 @router.post("/signup-code")
-def submit_signup_code(
+async def submit_signup_code(
     code: dict[Literal["code"], str] = Body(),
     user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.User:
     if user.premium.status:
-        return user
+        return await async_crud.with_read_articles(user)
 
     if code["code"] in config_options.SIGNUP_CODES:
         diff = datetime.now(UTC) + config_options.SIGNUP_CODES[code["code"]]
@@ -96,28 +95,32 @@ def submit_signup_code(
             detail="A wrong signup code was entered",
         )
 
-    update_user(user)
-    return user
+    await async_crud.update_user(user)
+    return await async_crud.with_read_articles(user)
 
 
 @router.post("/acknowledge-premium")
-def acknowledge_premium(
+async def acknowledge_premium(
     user: Annotated[schemas.User, Depends(ensure_user_from_request)],
     field: Annotated[str, Body()],
     status: Annotated[bool, Body()],
 ) -> schemas.User:
     user.premium.acknowledged[field] = status
-    update_user(user)
-    return user
+    await async_crud.update_user(user)
+    return await async_crud.with_read_articles(user)
 
 
 @router.put("/read-articles")
-def update_read_articles(
+async def update_read_articles(
     user: Annotated[schemas.User, Depends(ensure_user_from_request)],
     article_ids: Annotated[list[str], Body()],
 ) -> schemas.User:
-    user.read_articles = article_ids
-    update_user(user)
+    history = await async_crud.get_read_history(user)
+    history.articles = {}
+    history.add(reversed(article_ids), config_options.READ_HISTORY_SIZE)
+    await async_crud.save_read_history(history)
+
+    user.read_articles = history.recent()
     return user
 
 
@@ -125,6 +128,9 @@ def update_read_articles(
 def regenerate_api_key(user: Annotated[schemas.User, Depends(ApiAuthorizer)]) -> str:
     user.api_key = generate_api_key()
     update_user(user)
+
+    # The old key might still be mapped to the user in the lookup cache
+    user_cache.invalidate(user.id)
     return user.api_key.get_secret_value()
 
 
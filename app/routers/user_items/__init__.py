@@ -1,11 +1,11 @@
+from collections.abc import AsyncIterator
 from datetime import date
-from io import BytesIO
 from typing import Annotated, cast
 from uuid import UUID
 
 import couchdb
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response
 from starlette.status import (
     HTTP_403_FORBIDDEN,
     HTTP_404_NOT_FOUND,
@@ -14,10 +14,11 @@ from starlette.status import (
 
 from app.users.auth.dependencies import UserAuthorizer
 from app.common import EsIDList
-from app.dependencies import FastapiArticleSearchQuery
-from app.users import crud, models, schemas
+from app.dependencies import ArticlePagination, FastapiArticleSearchQuery
+from app.users import async_crud, crud, models, schemas
 from app.users.auth import ensure_user_from_request
 from app.utils.documents import convert_article_query_to_zip, send_file
+from app.utils.percolator import index_feed, remove_feed
 from modules.objects import BaseArticle, FullArticle
 
 from ... import config_options
@@ -45,9 +46,9 @@ def delete_item(
     def remove_webhook_attachments(feed: schemas.Feed) -> None:
         webhooks = [
             schemas.Webhook.model_validate(webhook)
-            for webhook in models.Webhook.by_feed(config_options.couch_conn)[
-                str(feed.id)
-            ]
+            for webhook in models.Webhook.by_feed(
+                config_options.couch_conn, include_docs=True
+            )[str(feed.id)]
         ]
 
         if len(webhooks) == 0:
@@ -86,17 +87,21 @@ def delete_item(
     except couchdb.http.ResourceNotFound:
         raise HTTPException(HTTP_404_NOT_FOUND, "The requested item was not found")
 
+    if isinstance(item, schemas.Feed):
+        remove_feed(item.id)
+
 
 @router.get(
     "/{item_id}/articles",
     response_model_exclude_unset=True,
     dependencies=[Depends(ArticleAuthorizer)],
 )
-def get_item_articles(
+async def get_item_articles(
+    pagination: Annotated[ArticlePagination, Depends(ArticlePagination)],
     search_query: FastapiArticleSearchQuery = Depends(get_query_from_item),
     complete: bool = Query(False),
 ) -> list[BaseArticle] | list[FullArticle]:
-    return config_options.es_article_client.query_documents(search_query, complete)[0]
+    return await pagination.query_articles(search_query, complete)
 
 
 @router.get(
@@ -105,8 +110,10 @@ def get_item_articles(
     response_model_exclude_none=True,
     response_model=schemas.UserItem,
 )
-def get_item_contents(item_id: UUID) -> schemas.FeedItemBase:
-    return handle_crud_response(crud.get_item(item_id, ("feed", "collection")))
+async def get_item_contents(item_id: UUID) -> schemas.FeedItemBase:
+    return handle_crud_response(
+        await async_crud.get_item(item_id, ("feed", "collection"))
+    )
 
 
 @router.get(
@@ -114,10 +121,10 @@ def get_item_contents(item_id: UUID) -> schemas.FeedItemBase:
     response_model_exclude_unset=True,
     dependencies=[Depends(ArticleAuthorizer)],
 )
-def export_item_articles(
+async def export_item_articles(
     search_query: FastapiArticleSearchQuery = Depends(get_query_from_item),
-) -> StreamingResponse:
-    zip_file: BytesIO = convert_article_query_to_zip(search_query)
+) -> Response:
+    zip_file: AsyncIterator[bytes] = await convert_article_query_to_zip(search_query)
 
     return send_file(
         file_name=f"OSINTer-MD-articles-{date.today()}-Item-Download.zip",
@@ -127,12 +134,12 @@ def export_item_articles(
 
 
 @router.put("/{item_id}/name", responses=responses)
-def update_item_name(
+async def update_item_name(
     item_id: UUID,
     new_name: str,
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.Feed | schemas.Collection:
-    item: int | schemas.Feed | schemas.Collection = crud.change_item_name(
+    item: int | schemas.Feed | schemas.Collection = await async_crud.change_item_name(
         item_id, new_name, current_user
     )
     r = cast(schemas.Feed | schemas.Collection, handle_crud_response(item))
@@ -148,7 +155,9 @@ def update_feed(
 
     webhooks = [
         schemas.Webhook.model_validate(webhook)
-        for webhook in models.Webhook.by_feed(config_options.couch_conn)[str(feed.id)]
+        for webhook in models.Webhook.by_feed(
+            config_options.couch_conn, include_docs=True
+        )[str(feed.id)]
     ]
 
     if (
@@ -178,6 +187,7 @@ def update_feed(
         feed = update_last_article(feed)
 
     config_options.couch_conn[str(feed.id)] = feed.db_serialize()
+    index_feed(feed)
 
     return feed
 
@@ -186,11 +196,13 @@ def update_feed(
     "/collection/{collection_id}",
     responses=responses,
 )
-def update_collection(
+async def update_collection(
     collection_id: UUID,
     contents: EsIDList,
     current_user: schemas.User = Depends(ensure_user_from_request),
 ) -> schemas.Collection:
     return handle_crud_response(
-        crud.modify_collection(id=collection_id, contents=contents, user=current_user)
+        await async_crud.modify_collection(
+            id=collection_id, contents=contents, user=current_user
+        )
     )
@@ -6,12 +6,12 @@ from fastapi import Depends, HTTPException, status
 
 from app.common import HTTPError
 from app.dependencies import FastapiArticleSearchQuery
-from app.users import crud, schemas
+from app.users import async_crud, schemas
 
 from app.users.auth import ensure_user_from_request
 from app.users.auth.dependencies import get_source_exclusions, UserAuthorizer
+from app.utils.watermarks import latest_watermark
 
-from ... import config_options
 
 responses: dict[int | str, dict[str, Any]] = {
     404: {
@@ -56,10 +56,12 @@ def handle_crud_response(response: R | int) -> R:
     return response
 
 
-def get_query_from_item(
+async def get_query_from_item(
     item_id: UUID, exclusions: Annotated[list[str], Depends(get_source_exclusions)]
 ) -> FastapiArticleSearchQuery | None:
-    item = handle_crud_response(crud.get_item(item_id, ("feed", "collection")))
+    item = handle_crud_response(
+        await async_crud.get_item(item_id, ("feed", "collection"))
+    )
 
     if isinstance(
         item, schemas.FeedCreate | schemas.Collection
@@ -70,10 +72,10 @@ def get_query_from_item(
         return handle_crud_response(404)
 
 
-def get_own_feed(
+async def get_own_feed(
     feed_id: UUID, user: Annotated[schemas.User, Depends(ensure_user_from_request)]
 ) -> schemas.Feed:
-    item = handle_crud_response(crud.get_item(feed_id, "feed"))
+    item = handle_crud_response(await async_crud.get_item(feed_id, "feed"))
 
     if item.owner != user.id:
         handle_crud_response(403)
@@ -81,11 +83,11 @@ def get_own_feed(
     return item
 
 
-def get_own_webhook(
+async def get_own_webhook(
     webhook_id: UUID, user: Annotated[schemas.User, Depends(ensure_user_from_request)]
 ) -> schemas.Webhook:
     WebhookAuthorizer(user)
-    item = handle_crud_response(crud.get_item(webhook_id, "webhook"))
+    item = handle_crud_response(await async_crud.get_item(webhook_id, "webhook"))
 
     if item.owner != user.id:
         handle_crud_response(403)
@@ -94,13 +96,6 @@ def get_own_webhook(
 
 
 def update_last_article(feed: schemas.Feed) -> schemas.Feed:
-    q = FastapiArticleSearchQuery.from_item(feed, [])
-    q.limit = 1
-
-    try:
-        article = config_options.es_article_client.query_documents(q, False)[0][0]
-        feed.webhooks.last_article = article.id
-    except IndexError:
-        feed.webhooks.last_article = ""
+    feed.webhooks = latest_watermark(feed)
 
     return feed
@@ -1,12 +1,13 @@
-from typing import Annotated
-from couchdb.client import ViewResults
+from typing import Annotated, cast
 from fastapi import APIRouter, Body, Depends, HTTPException
 from pydantic import SecretStr
 from starlette.status import HTTP_403_FORBIDDEN, HTTP_422_UNPROCESSABLE_ENTITY
 
 from app import config_options
 from app.connectors import WebhookType, connectors
-from app.users import schemas, models
+from app.users import async_crud, schemas, models
+from app.users.crud import get_view_ids
+from app.utils.couch import couch_async_conn
 
 from app.users.auth import ensure_user_from_request
 from app.users.auth.common import WebhookLimits
@@ -33,10 +34,11 @@ async def create_webhook(
     webhook_limits: Annotated[WebhookLimits, Depends(get_webhook_limits)],
 ) -> schemas.Webhook:
     if webhook_limits["max_count"] > 0:
-        webhook_view: ViewResults = models.Webhook.by_owner(config_options.couch_conn)
-        webhook_view.options["key"] = str(user.id)
+        webhook_ids = await async_crud.get_view_ids(
+            models.Webhook.by_owner, key=str(user.id)
+        )
 
-        if len(webhook_view) >= webhook_limits["max_count"]:
+        if len(webhook_ids) >= webhook_limits["max_count"]:
             raise HTTPException(
                 HTTP_403_FORBIDDEN,
                 f"User is only allowed {webhook_limits['max_count']} webhooks",
@@ -51,9 +53,7 @@ async def create_webhook(
         name=webhook_name, owner=user.id, url=SecretStr(url), hook_type=webhook_type
     )
 
-    config_options.couch_conn[str(webhook.id)] = webhook.db_serialize(
-        context={"show_secrets": True}
-    )
+    await couch_async_conn.save(webhook.db_serialize(context={"show_secrets": True}))
 
     return webhook
 
@@ -84,21 +84,20 @@ async def update_webhook(
         ):
             raise HTTPException(HTTP_422_UNPROCESSABLE_ENTITY, "Webhook url is invalid")
 
-    config_options.couch_conn[str(webhook.id)] = webhook.db_serialize(
-        context={"show_secrets": True}
-    )
+    await couch_async_conn.save(webhook.db_serialize(context={"show_secrets": True}))
 
     return webhook
 
 
 @router.get("/list")
-def list_webhooks(
+async def list_webhooks(
     user: Annotated[schemas.User, Depends(ensure_user_from_request)]
 ) -> list[schemas.Webhook]:
-    webhook_view: ViewResults = models.Webhook.by_owner(config_options.couch_conn)
-    webhook_view.options["key"] = str(user.id)
+    rows = await couch_async_conn.view(
+        models.Webhook.by_owner, key=str(user.id), include_docs=True
+    )
 
-    return [schemas.Webhook.model_validate(doc) for doc in webhook_view]
+    return [schemas.Webhook.model_validate(row["doc"]) for row in rows]
 
 
 @router.put("/{webhook_id}/feed", responses=responses, tags=["webhooks"])
@@ -124,7 +123,7 @@ def attach_webhook_to_feed(
 
     webhook.attached_feeds.add(feed.id)
 
-    if len(models.Webhook.by_feed(config_options.couch_conn)[str(feed.id)]) == 0:
+    if len(get_view_ids(models.Webhook.by_feed, key=str(feed.id))) == 0:
         feed = update_last_article(feed)
         config_options.couch_conn[str(feed.id)] = feed.db_serialize()
 
@@ -153,10 +152,10 @@ def detach_webhook_from_feed(
 
 
 @router.get("/{webhook_id}/feeds", tags=["webhooks"])
-def get_webhook_feeds(
+async def get_webhook_feeds(
     webhook: Annotated[schemas.Webhook, Depends(get_own_webhook)]
 ) -> list[schemas.Feed]:
-    feeds_view: ViewResults = models.Feed.all(config_options.couch_conn)
-    feeds_view.options["keys"] = [str(id) for id in webhook.attached_feeds]
-
-    return [schemas.Feed.model_validate(feed) for feed in feeds_view]
+    return cast(
+        list[schemas.Feed],
+        await async_crud.get_user_items(webhook.attached_feeds, "feed"),
+    )
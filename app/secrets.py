@@ -1,9 +1,24 @@
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
 import secrets
+from threading import Lock
+from typing import ParamSpec, TypeVar
+
 from argon2 import PasswordHasher
 from argon2.exceptions import VerifyMismatchError
 from pydantic import SecretStr
 
-hasher = PasswordHasher()
+from app import config_options
+
+hasher = PasswordHasher(
+    time_cost=config_options.ARGON2_TIME_COST,
+    memory_cost=config_options.ARGON2_MEMORY_COST,
+    parallelism=config_options.ARGON2_PARALLELISM,
+)
+
+P = ParamSpec("P")
+R = TypeVar("R")
 
 
 def generate_api_key() -> SecretStr:
@@ -21,3 +36,59 @@ def verify_hash(hashed_value: str, raw_value: str) -> bool:
         return False
 
     return True
+
+
+def needs_rehash(hashed_value: str) -> bool:
+    """Whether the hash was made with other parameters than the current ones"""
+    return hasher.check_needs_rehash(hashed_value)
+
+
+class HashQueueFull(Exception):
+    """Raised when too many hashes are running or waiting, answered with a 503"""
+
+
+class HashExecutor:
+    """
+    Runs hashing in a small dedicated thread pool, keeping it off the event loop and
+    out of the threadpool used for sync routes. Once `max_pending` hashes are running
+    or waiting, further work is rejected instead of queueing up behind a burst of
+    logins
+    """
+
+    def __init__(self, workers: int, max_pending: int) -> None:
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="hasher"
+        )
+        self.max_pending = max_pending
+        self.pending = 0
+        self.lock = Lock()
+
+    async def run(self, func: Callable[P, R], *args: P.args, **kwargs: P.kwargs) -> R:
+        with self.lock:
+            if self.pending >= self.max_pending:
+                raise HashQueueFull(
+                    "Too many authentication attempts in progress, try again later"
+                )
+
+            self.pending += 1
+
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self.executor, lambda: func(*args, **kwargs)
+            )
+        finally:
+            with self.lock:
+                self.pending -= 1
+
+
+hash_executor = HashExecutor(
+    config_options.HASH_WORKERS, config_options.HASH_MAX_PENDING
+)
+
+
+async def hash_value_async(val: str) -> SecretStr:
+    return await hash_executor.run(hash_value, val)
+
+
+async def verify_hash_async(hashed_value: str, raw_value: str) -> bool:
+    return await hash_executor.run(verify_hash, hashed_value, raw_value)
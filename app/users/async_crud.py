@@ -0,0 +1,347 @@
+"""
+Async counterparts to the functions in crud, going through the async CouchDB client
+so that routes can await the database instead of occupying a thread from the
+threadpool. The sync functions remain for use outside the event loop
+"""
+
+from collections.abc import Iterable
+from typing import Any, Literal, cast, overload
+from uuid import UUID, uuid4
+
+from couchdb import ResourceConflict, ResourceNotFound
+from couchdb.mapping import ViewDefinition
+
+from app.secrets import hash_value_async, verify_hash_async
+from app.users import crud, models, schemas
+from app.users.auth.authorization import expire_premium
+from app.users.cache import user_cache
+from app.users.crud import ItemType, filter_documents, parse_item, user_items_adapter
+from app.utils.couch import couch_async_conn
+
+
+async def get_view_ids(view: ViewDefinition, **options: Any) -> list[str]:
+    return [row["id"] for row in await couch_async_conn.view(view, **options)]
+
+
+async def check_username(username: str) -> Literal[False] | schemas.User:
+    ids = await get_view_ids(models.User.by_username, key=username)
+    if not ids:
+        return False
+
+    return await get_user(ids[0]) or False
+
+
+async def verify_user(
+    id: UUID,
+    user: schemas.User | None = None,
+    username: str | None = None,
+    password: str | None = None,
+    email: str | None = None,
+) -> Literal[False] | schemas.User:
+    if not user:
+        user_query = await get_item(id, "user")
+
+        if isinstance(user_query, int):
+            return False
+
+        user = user_query
+
+    checks = crud.credentials_to_verify(user, username, password, email)
+    if checks is None:
+        return False
+
+    for hashed, value in checks:
+        if not await verify_hash_async(hashed, value):
+            return False
+
+    rehash = crud.credentials_to_rehash(user, password, email)
+    for field, value in rehash.items():
+        setattr(user, field, await hash_value_async(value))
+
+    if rehash:
+        try:
+            await update_user(user)
+        except ResourceConflict:
+            # The user will simply be rehashed on the next login instead
+            pass
+
+    return user
+
+
+async def create_user(
+    username: str,
+    password: str,
+    email: str | None = "",
+    id: UUID | None = None,
+    premium: schemas.UserPremium | None = None,
+) -> bool:
+    if await check_username(username):
+        return False
+
+    if not id:
+        id = uuid4()
+
+    user_schema = schemas.User(
+        _id=id,
+        username=username,
+        active=True,
+        hashed_password=await hash_value_async(password),
+        hashed_email=await hash_value_async(email) if email else None,
+        settings=schemas.UserSettings(),
+        payment=schemas.UserPayment(),
+        premium=premium if premium else schemas.UserPremium(),
+    )
+
+    await couch_async_conn.save(
+        user_schema.db_serialize(context={"show_secrets": True})
+    )
+    user_cache.invalidate(id)
+
+    return True
+
+
+async def get_documents(
+    ids: Iterable[UUID | str],
+    item_type: ItemType | tuple[ItemType, ItemType],
+) -> list[dict[str, Any]]:
+    rows = await couch_async_conn.all_docs(
+        keys=[str(id) for id in ids], include_docs=True
+    )
+
+    return filter_documents(rows, item_type)
+
+
+async def get_user_items(
+    ids: Iterable[UUID | str],
+    item_type: (
+        Literal["feed", "collection"] | tuple[Literal["feed"], Literal["collection"]]
+    ),
+) -> list[schemas.UserItem]:
+    return user_items_adapter.validate_python(await get_documents(ids, item_type))
+
+
+async def get_feeds(user: schemas.User) -> dict[str, schemas.Feed]:
+    feeds = cast(list[schemas.Feed], await get_user_items(user.feed_ids, "feed"))
+
+    return {str(feed.id): feed for feed in feeds}
+
+
+async def get_collections(user: schemas.User) -> dict[str, schemas.Collection]:
+    collections = cast(
+        list[schemas.Collection],
+        await get_user_items(user.collection_ids, "collection"),
+    )
+
+    return {str(collection.id): collection for collection in collections}
+
+
+@overload
+async def get_item(
+    id: UUID | str, item_type: Literal["user"], view: ViewDefinition | None = ...
+) -> schemas.User | int: ...
+@overload
+async def get_item(
+    id: UUID | str, item_type: Literal["feed"], view: ViewDefinition | None = ...
+) -> schemas.Feed | int: ...
+@overload
+async def get_item(
+    id: UUID | str, item_type: Literal["collection"], view: ViewDefinition | None = ...
+) -> schemas.Collection | int: ...
+@overload
+async def get_item(
+    id: UUID | str, item_type: Literal["webhook"], view: ViewDefinition | None = ...
+) -> schemas.Webhook | int: ...
+@overload
+async def get_item(
+    id: UUID | str,
+    item_type: tuple[Literal["feed"], Literal["collection"]],
+    view: ViewDefinition | None = ...,
+) -> schemas.Feed | schemas.Collection | int: ...
+@overload
+async def get_item(
+    id: UUID | str,
+    item_type: None | tuple[ItemType, ItemType] = ...,
+    view: ViewDefinition | None = ...,
+) -> schemas.Feed | schemas.Collection | schemas.Webhook | int: ...
+
+
+async def get_item(
+    id: UUID | str,
+    item_type: ItemType | tuple[ItemType, ItemType] | None = None,
+    view: ViewDefinition | None = None,
+) -> schemas.Feed | schemas.Collection | schemas.Webhook | schemas.User | int:
+    try:
+        if view:
+            item = (
+                await couch_async_conn.view(view, key=str(id), include_docs=True)
+            )[0]["doc"]
+        else:
+            item = await couch_async_conn.get(str(id))
+    except (ResourceNotFound, IndexError):
+        return 404
+
+    return parse_item(item, item_type)
+
+
+async def get_user(id: UUID | str) -> schemas.User | None:
+    user = user_cache.get(id)
+    if user:
+        return user
+
+    version = user_cache.version
+    user_query = await get_item(id, "user")
+
+    if isinstance(user_query, int):
+        return None
+
+    user_cache.put(user_query, version)
+    return user_query
+
+
+async def migrate_read_history(user: schemas.User) -> None:
+    if not user.read_articles:
+        return
+
+    try:
+        await couch_async_conn.save(crud.legacy_read_history(user).db_serialize())
+    except ResourceConflict:
+        # The user has already been migrated
+        pass
+
+
+async def update_user(user: schemas.User) -> None:
+    user = expire_premium(user)
+    await migrate_read_history(user)
+
+    _, rev = await couch_async_conn.save(
+        user.db_serialize(context={"show_secrets": True})
+    )
+
+    user.rev = rev
+    user_cache.put(user)
+
+
+async def modify_user_subscription(
+    user_id: UUID,
+    ids: list[UUID],
+    action: Literal["subscribe", "unsubscribe"],
+    item_type: Literal["feed", "collection"],
+) -> schemas.User | None:
+    user = await get_item(user_id, "user")
+
+    if isinstance(user, int):
+        return None
+
+    crud.apply_subscription(user, ids, action, item_type)
+
+    await migrate_read_history(user)
+    await couch_async_conn.save(user.db_serialize(context={"show_secrets": True}))
+    user_cache.invalidate(user.id)
+
+    return user
+
+
+async def get_read_history(user: schemas.User) -> schemas.ReadHistory:
+    try:
+        return schemas.ReadHistory.model_validate(
+            await couch_async_conn.get(schemas.ReadHistory.get_id(user.id))
+        )
+    except ResourceNotFound:
+        # Users from before the read history was split from the user document
+        return crud.legacy_read_history(user)
+
+
+async def with_read_articles(user: schemas.User) -> schemas.User:
+    """Fills in the recently read articles, which are stored in the read history"""
+    user.read_articles = (await get_read_history(user)).recent()
+    return user
+
+
+async def save_read_history(history: schemas.ReadHistory) -> None:
+    _, rev = await couch_async_conn.save(history.db_serialize())
+    history.rev = rev
+
+
+async def create_feed(
+    feed_params: schemas.FeedCreate,
+    name: str,
+    owner: UUID,
+    id: UUID | None = None,
+    deleteable: bool = True,
+) -> schemas.Feed:
+    if not id:
+        id = uuid4()
+
+    feed = schemas.Feed(
+        name=name,
+        _id=id,
+        deleteable=deleteable,
+        owner=owner,
+        **feed_params.model_dump(),
+    )
+
+    await couch_async_conn.save(feed.db_serialize())
+
+    return feed
+
+
+async def create_collection(
+    name: str,
+    owner: UUID,
+    id: UUID | None = None,
+    ids: set[str] | None = None,
+    deleteable: bool = True,
+) -> schemas.Collection:
+    if not id:
+        id = uuid4()
+
+    collection = schemas.Collection(
+        name=name,
+        owner=owner,
+        _id=id,
+        deleteable=deleteable,
+    )
+
+    if ids:
+        collection.ids = ids
+
+    await couch_async_conn.save(collection.db_serialize())
+
+    return collection
+
+
+async def modify_collection(
+    id: UUID,
+    contents: set[str],
+    user: schemas.User,
+    action: Literal["replace", "extend"] = "replace",
+) -> int | schemas.Collection:
+    collection = await get_item(id, "collection")
+
+    if isinstance(collection, int):
+        return collection
+
+    if error := crud.apply_collection_change(collection, contents, user, action):
+        return error
+
+    await couch_async_conn.save(collection.db_serialize())
+
+    return collection
+
+
+async def change_item_name(
+    id: UUID, new_name: str, user: schemas.User
+) -> int | schemas.Collection | schemas.Feed:
+    item = await get_item(id, ("feed", "collection"))
+
+    if isinstance(item, int):
+        return item
+
+    if item.owner != user.id:
+        return 403
+
+    item.name = new_name
+
+    await couch_async_conn.save(item.db_serialize())
+
+    return item
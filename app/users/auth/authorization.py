@@ -1,5 +1,7 @@
+from collections.abc import Iterable
 from datetime import UTC, datetime
-from typing import TypeGuard, TypeVar
+from itertools import product
+from typing import TypeAlias, TypeGuard, TypeVar
 
 from .common import (
     Area,
@@ -18,21 +20,42 @@ def is_level(level: str) -> TypeGuard[Level]:
     return level in levels
 
 
-def calc_allowed_areas(user: User | None) -> list[Area]:
-    if not user:
-        return []
+# Whether the user has premium, whether the user is enterprise and the level of the
+# subscription, if any
+AccessKey: TypeAlias = tuple[bool, bool, Level | None]
+
 
-    allowed_areas = set()
+def combine_areas(access_key: AccessKey) -> frozenset[Area]:
+    premium, enterprise, level = access_key
+    allowed_areas: set[Area] = set()
 
-    if user.premium:
+    if premium:
         allowed_areas.update(levels_access["premium"])
-    if user.enterprise:
+    if enterprise:
         allowed_areas.update(levels_access["enterprise"])
+    if level:
+        allowed_areas.update(levels_access[level])
 
-    if is_level(user.payment.subscription.level):
-        allowed_areas.update(levels_access[user.payment.subscription.level])
+    return frozenset(allowed_areas)
 
-    return list(allowed_areas)
+
+# Allowed areas for every possible combination, so that they don't have to be
+# computed on each request
+allowed_areas_by_access: dict[AccessKey, frozenset[Area]] = {
+    access_key: combine_areas(access_key)
+    for access_key in product((False, True), (False, True), (None, *levels))
+}
+
+
+def calc_allowed_areas(user: User | None) -> frozenset[Area]:
+    if not user:
+        return frozenset()
+
+    level = user.payment.subscription.level
+
+    return allowed_areas_by_access[
+        bool(user.premium), user.enterprise, level if is_level(level) else None
+    ]
 
 
 def calc_webhook_limits(user: User) -> WebhookLimits:
@@ -63,25 +86,34 @@ def calc_webhook_limits(user: User) -> WebhookLimits:
     return limits
 
 
-def calc_source_exclusions(allowed_areas: list[Area]) -> list[str]:
-    areas_to_fields: dict[Area, str] = {
-        "map": "ml.coordinates",
-        "cluster": "ml.cluster",
-        "similar": "similar",
-        "summary": "summary",
-    }
+areas_to_fields: dict[Area, str] = {
+    "map": "ml.coordinates",
+    "cluster": "ml.cluster",
+    "similar": "similar",
+    "summary": "summary",
+}
 
+
+def combine_source_exclusions(allowed_areas: Iterable[Area]) -> list[str]:
     return [v for k, v in areas_to_fields.items() if not k in allowed_areas]
 
 
-def authorize_user(user: User, areas: list[Area]) -> bool:
-    allowed_areas = calc_allowed_areas(user)
+source_exclusions_by_areas: dict[frozenset[Area], list[str]] = {
+    allowed_areas: combine_source_exclusions(allowed_areas)
+    for allowed_areas in {frozenset(), *allowed_areas_by_access.values()}
+}
+
+
+def calc_source_exclusions(allowed_areas: frozenset[Area]) -> list[str]:
+    try:
+        # Copied as the exclusions are handed on to the search queries
+        return source_exclusions_by_areas[allowed_areas].copy()
+    except KeyError:
+        return combine_source_exclusions(allowed_areas)
 
-    for area in areas:
-        if area not in allowed_areas:
-            return False
 
-    return True
+def authorize_user(user: User, areas: Iterable[Area]) -> bool:
+    return calc_allowed_areas(user).issuperset(areas)
 
 
 UserType = TypeVar("UserType", bound=User)
@@ -13,7 +13,7 @@ from app.users.schemas import User
 
 def get_allowed_areas(
     user: Annotated[User | None, Depends(get_user_from_request)]
-) -> list[Area]:
+) -> frozenset[Area]:
     return calc_allowed_areas(user)
 
 
@@ -24,14 +24,14 @@ def get_webhook_limits(
 
 
 def get_source_exclusions(
-    allowed_areas: Annotated[list[Area], Depends(get_allowed_areas)]
+    allowed_areas: Annotated[frozenset[Area], Depends(get_allowed_areas)]
 ) -> list[str]:
     return calc_source_exclusions(allowed_areas)
 
 
 class UserAuthorizer:
     def __init__(self, areas: list[Area]):
-        self.areas: list[Area] = areas
+        self.areas: frozenset[Area] = frozenset(areas)
 
     def __call__(
         self, user: Annotated[User, Depends(ensure_user_from_request)]
@@ -0,0 +1,227 @@
+from collections import Counter, OrderedDict
+import math
+import os
+import sqlite3
+from threading import Lock, local
+import time
+from typing import Protocol, TypedDict
+
+from fastapi import Depends, HTTPException, Request
+from fastapi.security import OAuth2PasswordRequestForm
+from starlette.status import HTTP_429_TOO_MANY_REQUESTS
+
+from app import config_options
+
+
+class BucketStore(Protocol):
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        """
+        Takes a token from the bucket, returning 0 if one was available and otherwise
+        the number of seconds until one will be
+        """
+        ...
+
+
+def refill(
+    tokens: float, updated: float, now: float, capacity: float, rate: float
+) -> float:
+    return min(capacity, tokens + (now - updated) * rate)
+
+
+class MemoryBucketStore:
+    """
+    Token buckets kept in the memory of the worker. The number of buckets is capped,
+    evicting the least recently used bucket first, so memory stays bounded even when
+    every bucket is in use
+    """
+
+    def __init__(self, max_keys: int = 100_000) -> None:
+        self.max_keys = max_keys
+        # Tokens and time of last update, ordered from least to most recently used
+        self.buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+        self.lock = Lock()
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        now = time.monotonic()
+
+        with self.lock:
+            if key in self.buckets:
+                tokens, updated = self.buckets[key]
+                tokens = refill(tokens, updated, now, capacity, rate)
+                self.buckets.move_to_end(key)
+            else:
+                tokens = capacity
+
+            if tokens < 1:
+                return (1 - tokens) / rate
+
+            self.buckets[key] = (tokens - 1, now)
+
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+
+        return 0
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets stored in an SQLite database on the local disk, so that they are
+    shared by all the gunicorn workers on the host
+    """
+
+    def __init__(
+        self, path: str, prune_interval: int = 1000, busy_wait: float = 1
+    ) -> None:
+        self.path = path
+        self.prune_interval = prune_interval
+        self.busy_wait = busy_wait
+        self.takes = 0
+
+        # sqlite connections can't be shared between threads or forked processes
+        self.connections = local()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        conn = self.connect()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                full_at REAL NOT NULL
+            )"""
+        )
+        conn.close()
+
+    def connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=1, isolation_level=None)
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if getattr(self.connections, "pid", None) != os.getpid():
+            self.connections.conn = self.connect()
+            self.connections.pid = os.getpid()
+
+        conn: sqlite3.Connection = self.connections.conn
+        return conn
+
+    def take(self, key: str, capacity: float, rate: float) -> float:
+        # Wall clock time, as the monotonic clock isn't shared between processes
+        now = time.time()
+        conn = self.connection
+
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            # The database stayed locked by other workers through the timeout, which
+            # only happens under a flood of attempts, so the attempt is rejected
+            return self.busy_wait
+
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+
+            tokens = refill(row[0], row[1], now, capacity, rate) if row else capacity
+
+            if tokens < 1:
+                conn.execute("COMMIT")
+                return (1 - tokens) / rate
+
+            tokens -= 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?, ?)",
+                (key, tokens, now, now + (capacity - tokens) / rate),
+            )
+
+            self.takes += 1
+            if self.takes % self.prune_interval == 0:
+                conn.execute("DELETE FROM buckets WHERE full_at <= ?", (now,))
+
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+        return 0
+
+
+class ThrottleStats(TypedDict):
+    store: str
+    allowed: int
+    rejected_ip: int
+    rejected_username: int
+
+
+class LoginThrottle:
+    """
+    Limits login attempts using token buckets per source IP and per username, so that
+    attempts beyond the limits are rejected before any password is hashed
+    """
+
+    def __init__(
+        self,
+        store: BucketStore,
+        ip_burst: int,
+        ip_per_minute: float,
+        username_burst: int,
+        username_per_minute: float,
+    ) -> None:
+        self.store = store
+        self.ip_limit = (float(ip_burst), ip_per_minute / 60)
+        self.username_limit = (float(username_burst), username_per_minute / 60)
+
+        self.metrics: Counter[str] = Counter()
+
+    def check(self, ip: str, username: str) -> None:
+        wait = self.store.take(f"ip:{ip}", *self.ip_limit)
+        if wait > 0:
+            self.metrics["rejected_ip"] += 1
+        else:
+            wait = self.store.take(f"username:{username.lower()}", *self.username_limit)
+            if wait > 0:
+                self.metrics["rejected_username"] += 1
+
+        if wait > 0:
+            raise HTTPException(
+                HTTP_429_TOO_MANY_REQUESTS,
+                "Too many login attempts, try again later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+        self.metrics["allowed"] += 1
+
+    def stats(self) -> ThrottleStats:
+        """Counts of login attempts handled by this worker"""
+        return {
+            "store": type(self.store).__name__,
+            "allowed": self.metrics["allowed"],
+            "rejected_ip": self.metrics["rejected_ip"],
+            "rejected_username": self.metrics["rejected_username"],
+        }
+
+
+login_throttle = LoginThrottle(
+    (
+        SQLiteBucketStore(config_options.LOGIN_THROTTLE_DB)
+        if config_options.LOGIN_THROTTLE_STORE == "sqlite"
+        else MemoryBucketStore()
+    ),
+    config_options.LOGIN_IP_BURST,
+    config_options.LOGIN_IP_PER_MINUTE,
+    config_options.LOGIN_USERNAME_BURST,
+    config_options.LOGIN_USERNAME_PER_MINUTE,
+)
+
+
+def throttle_login(
+    request: Request, form_data: OAuth2PasswordRequestForm = Depends()
+) -> None:
+    # Behind a reverse proxy this is only the address of the client if the proxy is
+    # trusted through FORWARDED_ALLOW_IPS, as otherwise all attempts share the
+    # address of the proxy
+    login_throttle.check(
+        request.client.host if request.client else "unknown", form_data.username
+    )
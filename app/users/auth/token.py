@@ -1,4 +1,9 @@
+from collections import OrderedDict
 from datetime import UTC, datetime, timedelta
+from hashlib import sha256
+import hmac
+from threading import Lock
+import time
 from typing import Any
 from uuid import UUID
 
@@ -28,6 +33,64 @@ def create_access_token(
     return encoded_jwt
 
 
+def decode_token(token: str) -> dict[str, Any] | None:
+    try:
+        payload: dict[str, Any] = jwt.decode(
+            token, config_options.SECRET_KEY, algorithms=config_options.JWT_ALGORITHMS
+        )
+        return payload
+    except JWTError:
+        return None
+
+
+class TokenCache:
+    """
+    Bounded cache of verified tokens, keyed by a digest of the token made with the
+    secret key, so that entries don't outlive a change of the key. Entries are only
+    used until the token expires, so a cached token is never accepted after it would
+    have been rejected by decoding it
+    """
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self.tokens: OrderedDict[str, tuple[UUID | None, float]] = OrderedDict()
+        self.lock = Lock()
+
+    def get_id(self, token: str) -> UUID | None:
+        digest = hmac.new(
+            config_options.SECRET_KEY.encode(), token.encode(), sha256
+        ).hexdigest()
+
+        with self.lock:
+            entry = self.tokens.get(digest)
+
+            if entry and entry[1] > time.time():
+                self.tokens.move_to_end(digest)
+                return entry[0]
+
+        payload = decode_token(token)
+        if not payload:
+            return None
+
+        id: str | None = payload.get("sub")
+        user_id = UUID(id) if id else None
+
+        # Tokens without an expiry aren't cached, as they would never be evicted
+        # when the token stops being valid
+        if self.max_size > 0 and isinstance(payload.get("exp"), int | float):
+            with self.lock:
+                self.tokens[digest] = (user_id, payload["exp"])
+                self.tokens.move_to_end(digest)
+
+                while len(self.tokens) > self.max_size:
+                    self.tokens.popitem(last=False)
+
+        return user_id
+
+
+token_cache = TokenCache(config_options.JWT_CACHE_SIZE)
+
+
 async def get_id_from_token(request: Request) -> UUID | None:
     token = await oauth2_scheme(request)
 
@@ -35,15 +98,6 @@ async def get_id_from_token(request: Request) -> UUID | None:
         return None
 
     try:
-        payload = jwt.decode(
-            token, config_options.SECRET_KEY, algorithms=config_options.JWT_ALGORITHMS
-        )
-        id: str | None = payload.get("sub")
-
-        if id:
-            return UUID(id)
-        else:
-            return None
-
-    except JWTError:
+        return token_cache.get_id(token)
+    except ValueError:
         return None
@@ -0,0 +1,175 @@
+from collections import OrderedDict
+from hashlib import sha256
+from logging import getLogger
+from threading import Lock, Thread
+import time
+from typing import Any
+from uuid import UUID
+
+from couchdb import Server
+from couchdb.http import Session
+
+from app import config_options
+from app.users.schemas import User
+
+logger = getLogger("osinter")
+
+
+class UserLRU:
+    """
+    Process wide LRU cache of validated users. Entries are invalidated when the user
+    document changes in CouchDB, which is tracked by following the _changes feed.
+
+    Users are copied both when stored and when returned, as routes mutate the user
+    objects they receive.
+
+    API keys are mapped to user ids through a hash of the key, so that raw keys are
+    never kept in memory. These entries expire after `api_key_ttl` seconds, and are
+    dropped along with the user they point to.
+    """
+
+    def __init__(self, max_size: int, api_key_ttl: int) -> None:
+        self.max_size = max_size
+        self.users: OrderedDict[str, User] = OrderedDict()
+        self.lock = Lock()
+
+        self.api_key_ttl = api_key_ttl
+        self.api_keys: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self.api_key_hashes: dict[str, str] = {}
+
+        # Bumped on every invalidation, so that users fetched from the DB while a
+        # change was happening aren't cached
+        self.version = 0
+
+        # Nothing is cached unless the changes feed is followed
+        self.active = False
+
+    def get(self, id: UUID | str) -> User | None:
+        with self.lock:
+            user = self.users.get(str(id))
+            if user is None:
+                return None
+
+            self.users.move_to_end(str(id))
+
+        return user.model_copy(deep=True)
+
+    def put(self, user: User, version: int | None = None) -> None:
+        if not self.active or self.max_size < 1:
+            return
+
+        user = user.model_copy(deep=True)
+
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+
+            self.users[str(user.id)] = user
+            self.users.move_to_end(str(user.id))
+
+            while len(self.users) > self.max_size:
+                self.users.popitem(last=False)
+
+    def get_id_from_api_key(self, key: str) -> str | None:
+        key_hash = hash_api_key(key)
+
+        with self.lock:
+            entry = self.api_keys.get(key_hash)
+            if entry is None:
+                return None
+
+            id, expire_time = entry
+            if expire_time < time.monotonic():
+                self._remove_api_key(key_hash)
+                return None
+
+        return id
+
+    def put_api_key(self, key: str, id: UUID | str, version: int | None = None) -> None:
+        if not self.active or self.max_size < 1:
+            return
+
+        key_hash = hash_api_key(key)
+
+        with self.lock:
+            if version is not None and version != self.version:
+                return
+
+            # A user only ever has a single API key
+            if old_hash := self.api_key_hashes.get(str(id)):
+                self._remove_api_key(old_hash)
+
+            self.api_keys[key_hash] = (str(id), time.monotonic() + self.api_key_ttl)
+            self.api_key_hashes[str(id)] = key_hash
+
+            while len(self.api_keys) > self.max_size:
+                self._remove_api_key(next(iter(self.api_keys)))
+
+    def _remove_api_key(self, key_hash: str) -> None:
+        entry = self.api_keys.pop(key_hash, None)
+        if entry:
+            self.api_key_hashes.pop(entry[0], None)
+
+    def invalidate(self, id: UUID | str) -> None:
+        with self.lock:
+            self.version += 1
+            self.users.pop(str(id), None)
+
+            if key_hash := self.api_key_hashes.get(str(id)):
+                self._remove_api_key(key_hash)
+
+    def clear(self) -> None:
+        with self.lock:
+            self.version += 1
+            self.users.clear()
+            self.api_keys.clear()
+            self.api_key_hashes.clear()
+
+    def activate(self) -> None:
+        with self.lock:
+            # Users fetched before the feed's starting point was read may be stale
+            self.version += 1
+            self.active = True
+
+    def follow_changes(self) -> None:
+        # A session of its own, so that the feed doesn't hold a slot in the bounded
+        # pool, with heartbeats arriving well within the socket timeout
+        server = Server(
+            config_options.COUCHDB_URL,
+            session=Session(timeout=config_options.COUCHDB_TIMEOUT),
+        )
+        heartbeat = int(config_options.COUCHDB_TIMEOUT * 1000 / 3)
+
+        while True:
+            try:
+                db = server[config_options.COUCHDB_NAME]
+
+                # The feed only connects once it is iterated, so it is started from
+                # the sequence read up front instead of "now". That way changes made
+                # before the connection is established are still delivered
+                since: Any = db.info()["update_seq"]
+                self.activate()
+
+                for change in db.changes(
+                    feed="continuous", since=since, heartbeat=heartbeat
+                ):
+                    if "id" in change:
+                        self.invalidate(change["id"])
+            except Exception as e:
+                logger.warning(f"Lost connection to CouchDB changes feed: {e}")
+
+            # Entries can't be trusted while disconnected from the feed
+            self.active = False
+            self.clear()
+            time.sleep(5)
+
+    def start(self) -> None:
+        Thread(target=self.follow_changes, daemon=True).start()
+
+
+def hash_api_key(key: str) -> str:
+    # API keys are long random tokens, so a fast unsalted hash is sufficient
+    return sha256(key.encode()).hexdigest()
+
+
+user_cache = UserLRU(config_options.USER_CACHE_SIZE, config_options.API_KEY_CACHE_TTL)
@@ -1,24 +1,82 @@
-from typing import Literal, TypeAlias, overload
+from collections.abc import Iterable, Mapping
+from secrets import compare_digest
+from typing import Any, Literal, TypeAlias, cast, overload
 from uuid import UUID, uuid4
 
-from couchdb import Document, ResourceNotFound
-from couchdb.client import ViewResults
+from couchdb import Document, ResourceConflict, ResourceNotFound
 from couchdb.mapping import ViewDefinition
-from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
 
 from app import config_options
 from app.users.auth.authorization import expire_premium
-from app.secrets import hash_value, verify_hash
+from app.secrets import hash_value, needs_rehash, verify_hash
 from app.users import models, schemas
+from app.users.cache import user_cache
+
+ItemType: TypeAlias = Literal["feed", "collection", "webhook", "user"]
+
+
+def get_view_ids(view: ViewDefinition, **options: Any) -> list[str]:
+    """
+    Ids of the documents emitted by one of the views, which only emit keys. Queried
+    without the wrapper of the view, as the rows doesn't contain documents to wrap
+    """
+    return [
+        row.id
+        for row in config_options.couch_conn.view(
+            f"{view.design}/{view.name}", **options
+        )
+    ]
 
 
 def check_username(username: str) -> Literal[False] | schemas.User:
-    try:
-        user = list(models.User.by_username(config_options.couch_conn)[username])[0]
-        return schemas.User.model_validate(user)
-    except IndexError:
+    ids = get_view_ids(models.User.by_username, key=username)
+    if not ids:
         return False
 
+    return get_user(ids[0]) or False
+
+
+def credentials_to_verify(
+    user: schemas.User,
+    username: str | None = None,
+    password: str | None = None,
+    email: str | None = None,
+) -> list[tuple[str, str]] | None:
+    """
+    The hashes of the user, paired with the given values they have to match. None if
+    the username doesn't match, as it isn't hashed
+    """
+    if username and user.username != username:
+        return None
+
+    checks: list[tuple[str, str]] = []
+
+    if password:
+        checks.append((user.hashed_password.get_secret_value(), password))
+    if email and user.hashed_email:
+        checks.append((user.hashed_email.get_secret_value(), email))
+
+    return checks
+
+
+def credentials_to_rehash(
+    user: schemas.User, password: str | None = None, email: str | None = None
+) -> dict[Literal["hashed_password", "hashed_email"], str]:
+    """Verified values whose hashes were made with outdated parameters"""
+    rehash: dict[Literal["hashed_password", "hashed_email"], str] = {}
+
+    if password and needs_rehash(user.hashed_password.get_secret_value()):
+        rehash["hashed_password"] = password
+    if (
+        email
+        and user.hashed_email
+        and needs_rehash(user.hashed_email.get_secret_value())
+    ):
+        rehash["hashed_email"] = email
+
+    return rehash
+
 
 # Return of db model for user is for use in following crud functions
 def verify_user(
@@ -28,7 +86,6 @@ def verify_user(
     password: str | None = None,
     email: str | None = None,
 ) -> Literal[False] | schemas.User:
-    # TODO: Implement rehashing
     if not user:
         user_query = get_item(id, "user")
 
@@ -37,18 +94,22 @@ def verify_user(
 
         user = user_query
 
-    if username and user.username != username:
+    checks = credentials_to_verify(user, username, password, email)
+    if checks is None or not all(
+        verify_hash(hashed, value) for hashed, value in checks
+    ):
         return False
 
-    if password and not verify_hash(user.hashed_password.get_secret_value(), password):
-        return False
+    rehash = credentials_to_rehash(user, password, email)
+    for field, value in rehash.items():
+        setattr(user, field, hash_value(value))
 
-    if (
-        email
-        and user.hashed_email
-        and not verify_hash(user.hashed_email.get_secret_value(), email)
-    ):
-        return False
+    if rehash:
+        try:
+            update_user(user)
+        except ResourceConflict:
+            # The user will simply be rehashed on the next login instead
+            pass
 
     return user
 
@@ -88,6 +149,7 @@ def create_user(
     config_options.couch_conn[str(id)] = user_schema.db_serialize(
         context={"show_secrets": True}
     )
+    user_cache.invalidate(id)
 
     return True
 
@@ -97,33 +159,59 @@ def remove_user(username: str) -> bool:
 
     if user:
         del config_options.couch_conn[str(user.id)]
+        user_cache.invalidate(user.id)
     else:
         return False
 
     return True
 
 
+def legacy_read_history(user: schemas.User) -> schemas.ReadHistory:
+    """
+    The read history of users from before it was split from the user document, built
+    from the read articles still stored on the user
+    """
+    history = schemas.ReadHistory(
+        _id=schemas.ReadHistory.get_id(user.id), owner=user.id
+    )
+    history.add(reversed(user.read_articles), config_options.READ_HISTORY_SIZE)
+
+    return history
+
+
+def migrate_read_history(user: schemas.User) -> None:
+    """
+    Moves the read articles of users from before the read history was split from the
+    user document to a history document, as they are left out when saving the user
+    """
+    if not user.read_articles:
+        return
+
+    try:
+        config_options.couch_conn.save(legacy_read_history(user).db_serialize())
+    except ResourceConflict:
+        # The user has already been migrated
+        pass
+
+
 def update_user(user: schemas.User) -> None:
     user = expire_premium(user)
+    migrate_read_history(user)
 
     _, rev = config_options.couch_conn.save(
         user.db_serialize(context={"show_secrets": True})
     )
 
     user.rev = rev
+    user_cache.put(user)
 
 
-def modify_user_subscription(
-    user_id: UUID,
+def apply_subscription(
+    user: schemas.User,
     ids: list[UUID],
     action: Literal["subscribe", "unsubscribe"],
     item_type: Literal["feed", "collection"],
-) -> schemas.User | None:
-    user = get_item(user_id, "user")
-
-    if isinstance(user, int):
-        return None
-
+) -> None:
     if item_type == "feed":
         source = user.feed_ids
     elif item_type == "collection":
@@ -143,9 +231,25 @@ def modify_user_subscription(
     elif item_type == "collection":
         user.collection_ids = source
 
+
+def modify_user_subscription(
+    user_id: UUID,
+    ids: list[UUID],
+    action: Literal["subscribe", "unsubscribe"],
+    item_type: Literal["feed", "collection"],
+) -> schemas.User | None:
+    user = get_item(user_id, "user")
+
+    if isinstance(user, int):
+        return None
+
+    apply_subscription(user, ids, action, item_type)
+
+    migrate_read_history(user)
     config_options.couch_conn[str(user.id)] = user.db_serialize(
         context={"show_secrets": True}
     )
+    user_cache.invalidate(user.id)
 
     return user
 
@@ -198,26 +302,110 @@ def create_collection(
     return collection
 
 
-def get_feeds(user: schemas.User) -> dict[str, schemas.Feed]:
-    all_feeds: ViewResults = models.Feed.all(config_options.couch_conn)
+user_items_adapter: TypeAdapter[list[schemas.UserItem]] = TypeAdapter(
+    list[schemas.UserItem]
+)
+
+
+def get_documents(
+    ids: Iterable[UUID | str],
+    item_type: ItemType | tuple[ItemType, ItemType],
+) -> list[dict[str, Any]]:
+    """
+    Fetch documents by id in a single request to _all_docs. Missing, deleted and
+    documents of other types are skipped
+    """
+    rows = config_options.couch_conn.view(
+        "_all_docs", keys=[str(id) for id in ids], include_docs=True
+    )
+
+    return filter_documents(rows, item_type)
+
+
+def filter_documents(
+    rows: Iterable[Mapping[str, Any]],
+    item_type: ItemType | tuple[ItemType, ItemType],
+) -> list[dict[str, Any]]:
+    documents: list[dict[str, Any]] = []
+
+    for row in rows:
+        doc = row.get("doc")
+
+        if not doc or doc.get("type") not in (
+            (item_type,) if isinstance(item_type, str) else item_type
+        ):
+            continue
+
+        documents.append(doc)
+
+    return documents
+
 
-    all_feeds.options["keys"] = jsonable_encoder(user.feed_ids)
+def get_user_items(
+    ids: Iterable[UUID | str],
+    item_type: (
+        Literal["feed", "collection"] | tuple[Literal["feed"], Literal["collection"]]
+    ),
+) -> list[schemas.UserItem]:
+    """Fetch and validate feeds and collections in bulk, with a single validation pass"""
+    return user_items_adapter.validate_python(get_documents(ids, item_type))
 
-    return {feed._id: schemas.Feed.model_validate(feed) for feed in all_feeds}
+
+def get_feeds(user: schemas.User) -> dict[str, schemas.Feed]:
+    feeds = cast(list[schemas.Feed], get_user_items(user.feed_ids, "feed"))
+
+    return {str(feed.id): feed for feed in feeds}
 
 
 def get_collections(user: schemas.User) -> dict[str, schemas.Collection]:
-    all_collections: ViewResults = models.Collection.all(config_options.couch_conn)
+    collections = cast(
+        list[schemas.Collection], get_user_items(user.collection_ids, "collection")
+    )
 
-    all_collections.options["keys"] = jsonable_encoder(user.collection_ids)
+    return {str(collection.id): collection for collection in collections}
 
-    return {
-        collection._id: schemas.Collection.model_validate(collection)
-        for collection in all_collections
-    }
 
+def get_user(id: UUID | str) -> schemas.User | None:
+    """Get a user through the process wide user cache"""
+    user = user_cache.get(id)
+    if user:
+        return user
 
-ItemType: TypeAlias = Literal["feed", "collection", "webhook", "user"]
+    version = user_cache.version
+    user_query = get_item(id, "user")
+
+    if isinstance(user_query, int):
+        return None
+
+    user_cache.put(user_query, version)
+    return user_query
+
+
+def get_user_from_api_key(key: str) -> schemas.User | None:
+    """Resolve an API key to a user, caching which user id the key belongs to"""
+    id = user_cache.get_id_from_api_key(key)
+
+    if not id:
+        version = user_cache.version
+        ids = get_view_ids(models.User.by_api_key, key=key)
+        if not ids:
+            return None
+
+        id = ids[0]
+        user_cache.put_api_key(key, id, version)
+
+    user = get_user(id)
+
+    # Guards against the key having been regenerated since it was cached
+    if (
+        not user
+        or not user.api_key
+        or not compare_digest(user.api_key.get_secret_value(), key)
+    ):
+        user_cache.invalidate(id)
+        return None
+
+    return user
 
 
 @overload
@@ -258,12 +446,21 @@ def get_item(
 ) -> schemas.Feed | schemas.Collection | schemas.Webhook | schemas.User | int:
     try:
         if view:
-            item: Document = list(view(config_options.couch_conn)[str(id)])[0]
+            item: Document = list(
+                view(config_options.couch_conn, include_docs=True)[str(id)]
+            )[0]
         else:
             item = config_options.couch_conn[str(id)]
     except (ResourceNotFound, IndexError):
         return 404
 
+    return parse_item(item, item_type)
+
+
+def parse_item(
+    item: Mapping[str, Any],
+    item_type: ItemType | tuple[ItemType, ItemType] | None = None,
+) -> schemas.Feed | schemas.Collection | schemas.Webhook | schemas.User | int:
     if item_type:
         if isinstance(item_type, str) and item_type != item["type"]:
             return 404
@@ -282,19 +479,13 @@ def get_item(
         return 404
 
 
-def modify_collection(
-    id: UUID,
+def apply_collection_change(
+    collection: schemas.Collection,
     contents: set[str],
     user: schemas.User,
     action: Literal["replace", "extend"] = "replace",
-) -> int | schemas.Collection:
-    item = get_item(id, "collection")
-
-    if isinstance(item, int):
-        return item
-
-    collection = schemas.Collection.model_validate(item)
-
+) -> int | None:
+    """Changes the contents of the collection, returning a status code on failure"""
     if collection.owner != user.id:
         return 403
 
@@ -303,6 +494,23 @@ def modify_collection(
     elif action == "extend":
         collection.ids.update(contents)
 
+    return None
+
+
+def modify_collection(
+    id: UUID,
+    contents: set[str],
+    user: schemas.User,
+    action: Literal["replace", "extend"] = "replace",
+) -> int | schemas.Collection:
+    collection = get_item(id, "collection")
+
+    if isinstance(collection, int):
+        return collection
+
+    if error := apply_collection_change(collection, contents, user, action):
+        return error
+
     config_options.couch_conn[str(id)] = collection.db_serialize()
 
     return collection
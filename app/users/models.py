@@ -96,7 +96,7 @@ class User(BaseDocument):
         """
         function(doc) {
             if(doc.type == "user") {
-                emit(doc._id, doc);
+                emit(doc._id, null);
             }
         }""",
     )
@@ -106,7 +106,7 @@ class User(BaseDocument):
         """
         function(doc) {
             if(doc.type == "user") {
-                emit(doc.username, doc)
+                emit(doc.username, null)
             }
         }""",
     )
@@ -116,7 +116,7 @@ class User(BaseDocument):
         """
         function(doc) {
             if(doc.type == "user" && doc.api_key) {
-                emit(doc.api_key, doc)
+                emit(doc.api_key, null)
             }
         }""",
     )
@@ -126,7 +126,7 @@ class User(BaseDocument):
         """
         function(doc) {
             if(doc.type == "user" && doc.payment.stripe_id.length > 0) {
-                emit(doc.payment.stripe_id, doc)
+                emit(doc.payment.stripe_id, null)
             }
         }""",
     )
@@ -157,7 +157,7 @@ class Survey(BaseDocument):
         """
         function(doc) {
             if(doc.type == "survey") {
-                emit(doc._id, doc);
+                emit(doc._id, null);
             }
         }""",
     )
@@ -167,7 +167,7 @@ class Survey(BaseDocument):
         """
         function(doc) {
             if(doc.type == "survey") {
-                emit(doc.metadata.user_id, doc)
+                emit(doc.metadata.user_id, null)
             }
         }""",
     )
@@ -197,7 +197,13 @@ class Feed(FeedItemBase):
 
     sources = ListField(TextField())
 
-    webhooks = DictField(Mapping.build(last_article=TextField()))
+    webhooks = DictField(
+        Mapping.build(
+            last_article=TextField(),
+            last_inserted_at=IntegerField(),
+            recently_sent=DictField(),
+        )
+    )
 
     type = TextField(default="feed")
 
@@ -207,7 +213,7 @@ class Feed(FeedItemBase):
         """
         function(doc) {
             if(doc.type == "feed") {
-                emit(doc._id, doc);
+                emit(doc._id, null);
             }
         }""",
     )
@@ -234,7 +240,7 @@ class Collection(FeedItemBase):
         """
         function(doc) {
             if(doc.type == "collection") {
-                emit(doc._id, doc);
+                emit(doc._id, null);
             }
         }""",
     )
@@ -262,7 +268,7 @@ class Webhook(ItemBase):
         """
         function(doc) {
             if(doc.type == "webhook") {
-                emit(doc._id, doc);
+                emit(doc._id, null);
             }
         }""",
     )
@@ -272,7 +278,7 @@ class Webhook(ItemBase):
         """
         function(doc) {
             if(doc.type == "webhook") {
-                emit(doc.owner, doc)
+                emit(doc.owner, null)
             }
         }""",
     )
@@ -283,7 +289,7 @@ class Webhook(ItemBase):
         function(doc) {
             if(doc.type == "webhook") {
                 for (const id of doc.attached_feeds) {
-                    emit(id, doc)
+                    emit(id, null)
                 }
             }
         }""",
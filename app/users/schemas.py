@@ -1,15 +1,17 @@
-from collections.abc import Sequence, Set
+from collections.abc import Iterable, Sequence, Set
 from datetime import datetime, timezone
 from typing import Annotated, Any, Literal, TypeAlias, TypedDict, Union
 from uuid import UUID, uuid4
 from couchdb.mapping import ListField
 
 from pydantic import (
+    AliasChoices,
     BaseModel,
     ConfigDict,
     Field,
     FieldSerializationInfo,
     SecretStr,
+    ValidationInfo,
     field_serializer,
     field_validator,
 )
@@ -95,6 +97,24 @@ class FeedCreate(BaseModel):
 class FeedWebhooks(ORMBase):
     last_article: str = ""
 
+    # Watermark of the articles sent, as the insertion time in epoch millis of the
+    # newest one along with the ids and insertion times of those sent within
+    # WEBHOOK_INDEX_LAG of it, as articles might become searchable out of order. None
+    # for feeds that haven't been given a watermark yet
+    last_inserted_at: int | None = None
+    recently_sent: dict[str, int] = Field(
+        default={}, validation_alias=AliasChoices("recently_sent", "sent_at_last")
+    )
+
+    @field_validator("recently_sent", mode="before")
+    @classmethod
+    def convert_sent_at_last(cls, sent: Any, info: ValidationInfo) -> Any:
+        # Watermarks from before the lag window held the ids sent at the newest time
+        if isinstance(sent, Sequence | Set) and not isinstance(sent, str):
+            return dict.fromkeys(sent, info.data.get("last_inserted_at") or 0)
+
+        return sent
+
 
 class Feed(FeedItemBase, FeedCreate):
     webhooks: FeedWebhooks = FeedWebhooks()
@@ -216,6 +236,15 @@ class User(DBItemBase):
 
         return id_list
 
+    def db_serialize(
+        self, *, exclude: set[str] | None = None, **kwargs: Any
+    ) -> dict[str, Any]:
+        # Read articles are stored in the separate read history document, which the
+        # crud functions create from this list before saving users not yet migrated
+        return super().db_serialize(
+            exclude={"read_articles", *(exclude or set())}, **kwargs
+        )
+
     @field_serializer("hashed_password", "hashed_email", "api_key")
     def dump_secrets(
         self, v: SecretStr | None, info: FieldSerializationInfo
@@ -227,6 +256,48 @@ class User(DBItemBase):
         return None
 
 
+class ReadHistory(DBItemBase):
+    """
+    Articles read by a user, kept in a document of its own so that the user document
+    stays the same size. Held as an insertion ordered dict from least to most
+    recently read, and stored as a list from most to least recently read
+    """
+
+    id: str = Field(alias="_id")  # type: ignore[assignment]
+    owner: UUID
+    articles: dict[str, None] = {}
+
+    type: Literal["read_history"] = "read_history"
+
+    @staticmethod
+    def get_id(user_id: UUID) -> str:
+        return f"read_history:{user_id}"
+
+    @field_validator("articles", mode="before")
+    @classmethod
+    def convert_list(cls, articles: Any) -> Any:
+        if isinstance(articles, Sequence) and not isinstance(articles, str):
+            return dict.fromkeys(reversed(articles))
+
+        return articles
+
+    @field_serializer("articles")
+    def dump_list(self, articles: dict[str, None]) -> list[str]:
+        return list(reversed(articles))
+
+    def add(self, article_ids: Iterable[str], max_size: int) -> None:
+        """Add articles ordered from least to most recently read"""
+        for article_id in article_ids:
+            self.articles.pop(article_id, None)
+            self.articles[article_id] = None
+
+        while len(self.articles) > max_size:
+            del self.articles[next(iter(self.articles))]
+
+    def recent(self) -> list[str]:
+        return list(reversed(self.articles))
+
+
 class SurveySection(BaseModel):
     title: str
     rating: int
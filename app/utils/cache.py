@@ -0,0 +1,100 @@
+import fcntl
+import os
+import pickle
+import threading
+import time
+from collections.abc import Callable
+from logging import getLogger
+from typing import Generic, TypeVar
+
+logger = getLogger("osinter")
+
+T = TypeVar("T")
+
+
+class FileCache(Generic[T]):
+    """
+    Result cache stored on the local disk, so that it can be shared between all the
+    gunicorn workers running on the same host.
+
+    Entries are considered fresh for `ttl` seconds, after which they are served stale
+    for up to `stale_ttl` seconds while a single worker recomputes them in the
+    background. Only one process computes a given entry at a time, which is ensured
+    through an flock on a lock file next to the entry.
+    """
+
+    def __init__(self, name: str, ttl: int, stale_ttl: int, cache_dir: str) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, f"{name}.pickle")
+        self.lock_path = os.path.join(cache_dir, f"{name}.lock")
+
+    def _read(self) -> tuple[float, T] | None:
+        try:
+            with open(self.path, "rb") as f:
+                created, value = pickle.load(f)
+                return created, value
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+
+    def _write(self, value: T) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+
+        with open(tmp_path, "wb") as f:
+            pickle.dump((time.time(), value), f)
+
+        os.replace(tmp_path, self.path)
+
+    def _compute(self, lock_fd: int, compute: Callable[[], T]) -> T:
+        try:
+            value = compute()
+            self._write(value)
+            return value
+        finally:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+
+    def _refresh_in_background(self, compute: Callable[[], T]) -> None:
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            fcntl.flock(lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            # Another worker is already refreshing the entry
+            os.close(lock_fd)
+            return
+
+        def refresh() -> None:
+            try:
+                self._compute(lock_fd, compute)
+            except Exception as e:
+                logger.error(f'Error when refreshing cache at "{self.path}": {e}')
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def get(self, compute: Callable[[], T]) -> T:
+        entry = self._read()
+
+        if entry:
+            created, value = entry
+            age = time.time() - created
+
+            if age < self.ttl:
+                return value
+            elif age < self.ttl + self.stale_ttl:
+                self._refresh_in_background(compute)
+                return value
+
+        # No usable entry, so wait for whichever worker is computing it
+        lock_fd = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(lock_fd, fcntl.LOCK_EX)
+
+        entry = self._read()
+        if entry and time.time() - entry[0] < self.ttl:
+            fcntl.flock(lock_fd, fcntl.LOCK_UN)
+            os.close(lock_fd)
+            return entry[1]
+
+        return self._compute(lock_fd, compute)
@@ -0,0 +1,106 @@
+import json
+from typing import Any
+
+import aiohttp
+from couchdb.http import ResourceConflict, ResourceNotFound, ServerError
+from couchdb.mapping import ViewDefinition
+from yarl import URL
+
+from app import config_options
+
+
+class AsyncCouchDB:
+    """
+    Minimal async client for the CouchDB HTTP api, covering the requests used by the
+    crud functions. Errors are raised as the exceptions from the couchdb package, so
+    that they can be handled the same way as those from the sync client
+    """
+
+    def __init__(self, url: str, name: str, pool_size: int, timeout: float) -> None:
+        self.url = URL(url) / name
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._session: aiohttp.ClientSession | None = None
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # Created lazily, as the session has to be created within the event loop
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            )
+
+        return self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: dict[str, str] | None = None,
+        body: dict[str, Any] | None = None,
+    ) -> Any:
+        async with self.session.request(
+            method, self.url / path, params=params, json=body
+        ) as response:
+            if response.status < 400:
+                return await response.json(content_type=None)
+
+            # Errors may come from a proxy in front of CouchDB, in which case the
+            # body isn't necessarily JSON
+            text = await response.text()
+            try:
+                content = json.loads(text)
+                error = (content.get("error"), content.get("reason"))
+            except (ValueError, AttributeError):
+                error = (None, text)
+
+            if response.status == 404:
+                raise ResourceNotFound(error)
+            elif response.status == 409:
+                raise ResourceConflict(error)
+            else:
+                raise ServerError((response.status, error))
+
+    async def get(self, id: str) -> dict[str, Any]:
+        doc: dict[str, Any] = await self.request("GET", id)
+        return doc
+
+    async def save(self, doc: dict[str, Any]) -> tuple[str, str]:
+        response = await self.request("PUT", doc["_id"], body=doc)
+        return response["id"], response["rev"]
+
+    async def delete(self, id: str) -> None:
+        doc = await self.get(id)
+        await self.request("DELETE", id, params={"rev": doc["_rev"]})
+
+    async def query(self, path: str, **options: Any) -> list[dict[str, Any]]:
+        """Query a view using the same options as the sync client"""
+        keys = options.pop("keys", None)
+        params = {key: json.dumps(value) for key, value in options.items()}
+
+        if keys is None:
+            response = await self.request("GET", path, params=params)
+        else:
+            response = await self.request("POST", path, params, {"keys": keys})
+
+        rows: list[dict[str, Any]] = response["rows"]
+        return rows
+
+    async def view(self, view: ViewDefinition, **options: Any) -> list[dict[str, Any]]:
+        return await self.query(f"_design/{view.design}/_view/{view.name}", **options)
+
+    async def all_docs(self, **options: Any) -> list[dict[str, Any]]:
+        return await self.query("_all_docs", **options)
+
+
+couch_async_conn = AsyncCouchDB(
+    config_options.COUCHDB_URL,
+    config_options.COUCHDB_NAME,
+    config_options.COUCHDB_POOL_SIZE,
+    config_options.COUCHDB_TIMEOUT,
+)
@@ -1,32 +1,95 @@
-from io import BytesIO, StringIO
-from zipfile import ZipFile
+from collections.abc import AsyncIterator, Iterator
+from io import BytesIO, RawIOBase, StringIO
+import os
+from typing import IO, TYPE_CHECKING, TypeAlias
+from zipfile import ZIP_DEFLATED, ZipFile
 from pathvalidate import sanitize_filename
 
 from fastapi import Depends, HTTPException, status
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 
 from modules.files import article_to_md
 from modules.objects.articles import FullArticle
 
-from .. import config_options
 from ..dependencies import (
     FastapiArticleSearchQuery,
     FastapiQueryParamsArticleSearchQuery,
 )
+from .elastic import es_article_async_client
 
-# TODO:Optimize functions sending files (especially the zip file) as to not save
-# files in memory but on disk
+if TYPE_CHECKING:
+    from _typeshed import ReadableBuffer
 
+# Kept small, as rendering and compressing a batch happens on the event loop
+ZIP_BATCH_SIZE = 100
 
-def send_file(
-    file_name: str, file_content: str | StringIO | BytesIO, file_type: str
-) -> StreamingResponse:
-    if isinstance(file_content, str):
-        response = StreamingResponse(iter([file_content]), media_type=file_type)
-    else:
+
+FileContent: TypeAlias = (
+    str
+    | bytes
+    | memoryview
+    | StringIO
+    | BytesIO
+    | IO[bytes]
+    | os.PathLike[str]
+    | AsyncIterator[bytes]
+)
+
+SEND_CHUNK_SIZE = 64 * 1024
+
+
+async def iter_buffer(buffer: memoryview) -> AsyncIterator[memoryview]:
+    # Async, as StreamingResponse would otherwise iterate it through the threadpool,
+    # with a thread hop for every chunk even though slicing the view never blocks
+    for i in range(0, len(buffer), SEND_CHUNK_SIZE):
+        yield buffer[i : i + SEND_CHUNK_SIZE]
+
+
+# Sync, as reading a file that has been written to disk blocks
+def iter_file(file: IO[bytes]) -> Iterator[bytes]:
+    file.seek(0)
+    while chunk := file.read(SEND_CHUNK_SIZE):
+        yield chunk
+
+
+def send_file(file_name: str, file_content: FileContent, file_type: str) -> Response:
+    """
+    Sends the content as a download without copying it. In-memory buffers are sent
+    in fixed size chunks of views into the buffer, while files on disk are sent
+    using FileResponse. Content-Length is set whenever the size is known up front
+    """
+    response: Response
+    content_length: int | None = None
+
+    if isinstance(file_content, os.PathLike):
+        response = FileResponse(file_content, media_type=file_type)
+    elif isinstance(file_content, str | StringIO):
+        if isinstance(file_content, StringIO):
+            file_content = file_content.getvalue()
+
+        encoded = file_content.encode()
+        content_length = len(encoded)
         response = StreamingResponse(
-            iter([file_content.getvalue()]), media_type=file_type
+            iter_buffer(memoryview(encoded)), media_type=file_type
         )
+    elif isinstance(file_content, bytes | memoryview | BytesIO):
+        buffer = (
+            file_content.getbuffer()
+            if isinstance(file_content, BytesIO)
+            else memoryview(file_content).cast("B")
+        )
+        content_length = buffer.nbytes
+        response = StreamingResponse(iter_buffer(buffer), media_type=file_type)
+    elif isinstance(file_content, AsyncIterator):
+        response = StreamingResponse(file_content, media_type=file_type)
+    else:
+        # Binary file objects, such as spooled temporary files which may or may not
+        # have been written to disk
+        content_length = file_content.seek(0, os.SEEK_END)
+        response = StreamingResponse(iter_file(file_content), media_type=file_type)
+
+    if content_length is not None:
+        response.headers["Content-Length"] = str(content_length)
 
     response.headers["Content-Disposition"] = (
         f"attachment; filename={file_name.encode('ascii',errors='ignore').decode()}"
@@ -35,27 +98,68 @@ def send_file(
     return response
 
 
-def convert_article_query_to_zip(
+class ZipChunkBuffer(RawIOBase):
+    """
+    Write-only, unseekable stream collecting the output of a ZipFile, so that the
+    archive can be sent in chunks as it is written
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.chunks: list[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data: "ReadableBuffer") -> int:
+        chunk = bytes(data)
+        self.chunks.append(chunk)
+        return len(chunk)
+
+    def pop(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks.clear()
+        return data
+
+
+async def stream_articles_as_zip(
+    article_batches: AsyncIterator[list[FullArticle]],
+) -> AsyncIterator[bytes]:
+    buffer = ZipChunkBuffer()
+
+    with ZipFile(buffer, "w", compression=ZIP_DEFLATED) as zip_archive:
+        async for articles in article_batches:
+            for article in articles:
+                zip_archive.writestr(
+                    f"OSINTer-MD-articles/{sanitize_filename(article.source)}/{sanitize_filename(article.title)}.md",
+                    article_to_md(article),
+                )
+
+            yield buffer.pop()
+
+    # Central directory, written when the archive is closed
+    yield buffer.pop()
+
+
+async def convert_article_query_to_zip(
     search_q: FastapiArticleSearchQuery = Depends(FastapiQueryParamsArticleSearchQuery),
-) -> BytesIO:
-    articles = config_options.es_article_client.query_documents(search_q, True)[0]
+) -> AsyncIterator[bytes]:
+    article_batches = es_article_async_client.iterate_documents(
+        search_q, True, batch_size=ZIP_BATCH_SIZE
+    )
 
-    if articles:
-        return convert_articles_to_zip(articles)
-    else:
+    # The first batch is fetched up front, so that a missing result can still be
+    # reported with a status code before the response starts streaming
+    try:
+        first_batch: list[FullArticle] = await anext(article_batches)
+    except StopAsyncIteration:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Articles not found"
         )
 
+    async def all_batches() -> AsyncIterator[list[FullArticle]]:
+        yield first_batch
+        async for batch in article_batches:
+            yield batch
 
-def convert_articles_to_zip(articles: list[FullArticle]) -> BytesIO:
-    zip_file = BytesIO()
-
-    with ZipFile(zip_file, "w") as zip_archive:
-        for article in articles:
-            zip_archive.writestr(
-                f"OSINTer-MD-articles/{sanitize_filename(article.source)}/{sanitize_filename(article.title)}.md",
-                article_to_md(article),
-            )
-
-    return zip_file
+    return stream_articles_as_zip(all_batches())
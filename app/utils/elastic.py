@@ -0,0 +1,355 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+import binascii
+from collections.abc import AsyncIterator, Sequence
+from hashlib import sha256
+import json
+from typing import Any, TypedDict
+
+from elasticsearch import AsyncElasticsearch, Elasticsearch, NotFoundError
+from pydantic import BaseModel
+
+from app import config_options
+
+from modules.elastic import ElasticDB, SearchQuery
+from modules.objects import (
+    BaseArticle,
+    BaseCluster,
+    FullArticle,
+    FullCluster,
+    PartialArticle,
+)
+from modules.objects.cves import BaseCVE, FullCVE
+
+Completeness = bool | list[str]
+
+
+class DocumentModels(TypedDict):
+    base: type[BaseModel]
+    full: type[BaseModel]
+    partial: type[BaseModel]
+
+
+article_models: DocumentModels = {
+    "base": BaseArticle,
+    "full": FullArticle,
+    "partial": PartialArticle,
+}
+cve_models: DocumentModels = {"base": BaseCVE, "full": FullCVE, "partial": BaseCVE}
+cluster_models: DocumentModels = {
+    "base": BaseCluster,
+    "full": FullCluster,
+    "partial": BaseCluster,
+}
+
+
+def search_kwargs(
+    client: ElasticDB, query: SearchQuery, completeness: Completeness
+) -> dict[str, Any]:
+    """Converts a search query into the keyword arguments used for Elasticsearch.search"""
+    kwargs: dict[str, Any] = query.generate_es_query(client, completeness)
+    kwargs.pop("index", None)
+
+    return kwargs
+
+
+def search_body(
+    client: ElasticDB, query: SearchQuery, completeness: Completeness
+) -> dict[str, Any]:
+    """Converts a search query into the raw request body used by the msearch api"""
+    body = search_kwargs(client, query, completeness)
+
+    if "source" in body:
+        body["_source"] = body.pop("source")
+
+    return body
+
+
+def parse_hits(
+    hits: Sequence[dict[str, Any]], models: DocumentModels, completeness: Completeness
+) -> list[Any]:
+    if isinstance(completeness, list):
+        model = models["partial"]
+    elif completeness:
+        model = models["full"]
+    else:
+        model = models["base"]
+
+    documents = []
+
+    for hit in hits:
+        source = {"id": hit["_id"], **hit["_source"]}
+        if "highlight" in hit:
+            source["highlights"] = hit["highlight"]
+
+        documents.append(model.model_validate(source))
+
+    return documents
+
+
+class MultiSearch:
+    """
+    Collects multiple searches, possibly across several indices, and sends them to
+    Elasticsearch as a single msearch request
+    """
+
+    def __init__(self, es: Elasticsearch) -> None:
+        self.es = es
+        self.searches: list[dict[str, Any]] = []
+        self.completeness: list[tuple[DocumentModels, Completeness]] = []
+
+    def add(
+        self,
+        client: ElasticDB,
+        query: SearchQuery,
+        models: DocumentModels,
+        completeness: Completeness = False,
+    ) -> int:
+        self.searches.append({"index": client.index_name})
+        self.searches.append(search_body(client, query, completeness))
+        self.completeness.append((models, completeness))
+
+        return len(self.completeness) - 1
+
+    def execute(self) -> list[list[Any]]:
+        if not self.completeness:
+            return []
+
+        responses = self.es.msearch(searches=self.searches)["responses"]
+        results: list[list[Any]] = []
+
+        for response, (models, completeness) in zip(responses, self.completeness):
+            if "error" in response:
+                raise Exception(f"Error in multi-search: {response['error']}")
+
+            results.append(parse_hits(response["hits"]["hits"], models, completeness))
+
+        return results
+
+
+class AsyncElasticClient:
+    """
+    Async counterpart to the ElasticDB clients from the backend, mirroring the
+    interface of query_documents so that routes can await searches instead of
+    blocking the event loop
+    """
+
+    def __init__(
+        self, es: AsyncElasticsearch, client: ElasticDB, models: DocumentModels
+    ) -> None:
+        self.es = es
+        self.client = client
+        self.index_name: str = client.index_name
+        self.models = models
+
+    async def query_documents(
+        self, query: SearchQuery, completeness: Completeness = False
+    ) -> tuple[list[Any], int, dict[str, Any] | None]:
+        if 0 < query.limit <= 10_000:
+            response = await self.es.search(
+                index=self.index_name,
+                **search_kwargs(self.client, query, completeness),
+            )
+
+            return (
+                parse_hits(response["hits"]["hits"], self.models, completeness),
+                response["hits"]["total"]["value"],
+                response.get("aggregations"),
+            )
+
+        # Beyond the result window the documents are paged through with a point in
+        # time, which doesn't run aggregations, so the total and aggregations are
+        # fetched by a separate search without hits
+        summary = await self.es.search(
+            index=self.index_name,
+            **{
+                **search_kwargs(self.client, query, completeness),
+                "size": 0,
+                "track_total_hits": True,
+            },
+        )
+
+        documents: list[Any] = []
+        async for batch in self.iterate_documents(query, completeness):
+            documents.extend(batch)
+
+        return (
+            documents,
+            summary["hits"]["total"]["value"],
+            summary.get("aggregations"),
+        )
+
+    def _pit_kwargs(
+        self, query: SearchQuery, completeness: Completeness
+    ) -> tuple[dict[str, Any], list[Any]]:
+        kwargs = search_kwargs(self.client, query, completeness)
+        kwargs.pop("size", None)
+        kwargs.pop("aggs", None)
+        kwargs.pop("aggregations", None)
+
+        # _shard_doc is used as tiebreaker so search_after never skips documents
+        sort: list[Any] = kwargs.pop("sort", None) or ["_score"]
+        sort = [*sort, {"_shard_doc": "asc"}]
+
+        return kwargs, sort
+
+    async def iterate_documents(
+        self,
+        query: SearchQuery,
+        completeness: Completeness = False,
+        batch_size: int = 1_000,
+    ) -> AsyncIterator[list[Any]]:
+        """
+        Yields every document matched by the query in batches, using a point in time
+        and search_after. A limit of 0 means that all documents are returned
+        """
+        kwargs, sort = self._pit_kwargs(query, completeness)
+
+        remaining = query.limit if query.limit > 0 else None
+        search_after: list[Any] | None = None
+
+        pit_id: str = (
+            await self.es.open_point_in_time(index=self.index_name, keep_alive="1m")
+        )["id"]
+
+        try:
+            while remaining is None or remaining > 0:
+                size = batch_size if remaining is None else min(batch_size, remaining)
+
+                response = await self.es.search(
+                    pit={"id": pit_id, "keep_alive": "1m"},
+                    size=size,
+                    sort=sort,
+                    search_after=search_after,
+                    **kwargs,
+                )
+
+                pit_id = response["pit_id"]
+                hits = response["hits"]["hits"]
+
+                if not hits:
+                    break
+
+                yield parse_hits(hits, self.models, completeness)
+
+                search_after = hits[-1]["sort"]
+                if remaining is not None:
+                    remaining -= len(hits)
+        finally:
+            await self.es.close_point_in_time(id=pit_id)
+
+    async def query_page(
+        self,
+        query: SearchQuery,
+        completeness: Completeness,
+        page_size: int,
+        cursor: str | None = None,
+    ) -> tuple[list[Any], str | None]:
+        """
+        Returns a single page of documents along with an opaque cursor pointing to the
+        next page, or None if the last page has been reached. The cost of a page is
+        constant no matter how deep into the results it is
+        """
+        kwargs, sort = self._pit_kwargs(query, completeness)
+        query_hash = hash_query(kwargs, sort)
+
+        if cursor:
+            pit_id, search_after = decode_cursor(cursor, query_hash)
+        else:
+            pit_id = (
+                await self.es.open_point_in_time(
+                    index=self.index_name, keep_alive=PAGE_KEEP_ALIVE
+                )
+            )["id"]
+            search_after = None
+
+        try:
+            response = await self.es.search(
+                pit={"id": pit_id, "keep_alive": PAGE_KEEP_ALIVE},
+                size=page_size,
+                sort=sort,
+                search_after=search_after,
+                **kwargs,
+            )
+        except NotFoundError:
+            raise ValueError("Cursor has expired")
+
+        hits = response["hits"]["hits"]
+        documents = parse_hits(hits, self.models, completeness)
+
+        if len(hits) < page_size:
+            await self.es.close_point_in_time(id=response["pit_id"])
+            return documents, None
+
+        return documents, encode_cursor(
+            response["pit_id"], hits[-1]["sort"], query_hash
+        )
+
+
+PAGE_KEEP_ALIVE = "5m"
+
+
+class CursorMismatchError(ValueError):
+    """Raised when a cursor is used with a different query than it was created for"""
+
+
+def canonicalize(value: Any) -> Any:
+    """
+    Orders every list and set within the query, as their order doesn't change which
+    documents match, but lists built from sets come out in an order depending on the
+    hash seed of the worker
+    """
+    if isinstance(value, dict):
+        return {str(key): canonicalize(item) for key, item in value.items()}
+    elif isinstance(value, list | tuple | set | frozenset):
+        items = [canonicalize(item) for item in value]
+        return sorted(items, key=lambda item: json.dumps(item, sort_keys=True))
+    elif isinstance(value, str | int | float | bool) or value is None:
+        return value
+    else:
+        return str(value)
+
+
+def hash_query(kwargs: dict[str, Any], sort: list[Any]) -> str:
+    # The returned fields are left out, as they don't change which documents match.
+    # The sort is kept as is, since its order matters
+    query = {key: value for key, value in kwargs.items() if key != "source"}
+
+    return sha256(
+        json.dumps([canonicalize(query), sort], sort_keys=True, default=str).encode()
+    ).hexdigest()[:32]
+
+
+def encode_cursor(pit_id: str, search_after: list[Any], query_hash: str) -> str:
+    return urlsafe_b64encode(
+        json.dumps({"pit": pit_id, "after": search_after, "query": query_hash}).encode()
+    ).decode()
+
+
+def decode_cursor(cursor: str, query_hash: str) -> tuple[str, list[Any]]:
+    try:
+        content = json.loads(urlsafe_b64decode(cursor.encode()))
+        pit_id, search_after = str(content["pit"]), list(content["after"])
+        cursor_hash = content["query"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise ValueError("Cursor is invalid")
+
+    if cursor_hash != query_hash:
+        raise CursorMismatchError("Cursor belongs to a different query")
+
+    return pit_id, search_after
+
+
+es_async_conn = AsyncElasticsearch(
+    config_options.ELASTICSEARCH_URL,
+    ca_certs=config_options.ELASTICSEARCH_CERT_PATH,
+)
+
+es_article_async_client = AsyncElasticClient(
+    es_async_conn, config_options.es_article_client, article_models
+)
+es_cve_async_client = AsyncElasticClient(
+    es_async_conn, config_options.es_cve_client, cve_models
+)
+es_cluster_async_client = AsyncElasticClient(
+    es_async_conn, config_options.es_cluster_client, cluster_models
+)
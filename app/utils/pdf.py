@@ -4,7 +4,7 @@
 import io
 import re
 from string import Template
-from typing import Any
+from typing import Any, TypeAlias
 
 from markdown_it import MarkdownIt
 from markdown_it.token import Token
@@ -15,6 +15,10 @@ from modules.files import generate_substitution_mapping
 
 pymupdf.TOOLS.unset_quad_corrections(True)
 
+# Heading level, text, page number and top of the heading on the page
+TocEntry: TypeAlias = tuple[int, str, int, float]
+RenderedArticle: TypeAlias = tuple[bytes, list[TocEntry]]
+
 
 class MarkdownPdf:
     """Converter class."""
@@ -38,7 +42,7 @@ class MarkdownPdf:
     ):
         """Create md -> pdf converter with given TOC level and mode of md parsing."""
         self.toc_level = toc_level
-        self.toc: list[Any] = []
+        self.toc: list[TocEntry] = []
 
         self.paper_size = paper_size
         self.borders = borders
@@ -71,8 +75,7 @@ $auto_tags
         # https://markdown-it-py.readthedocs.io/en/latest/using.html#quick-start
         self.md = MarkdownIt(mode).enable("table")  # Enable support for tables
 
-        self.out_file = io.BytesIO()
-        self.writer = pymupdf.DocumentWriter(self.out_file)
+        self.rendered: list[RenderedArticle] = []
         self.page = 0
         self.title = title
 
@@ -133,9 +136,10 @@ $auto_tags
 
         return tokens
 
-    def add_article(
+    def render_article(
         self, article: FullArticle, user_css: str | None = None, toc: bool = True
-    ) -> None:
+    ) -> RenderedArticle:
+        """Lay out a single article as a standalone pdf with a TOC relative to it."""
         # Need to remove empty headings, see https://github.com/pymupdf/PyMuPDF/issues/3559
         markdown_str = self.template.substitute(
             **generate_substitution_mapping(article)
@@ -153,24 +157,69 @@ $auto_tags
         where = rect + self.borders
         story = pymupdf.Story(html=html, archive=".", user_css=user_css)
 
+        out_file = io.BytesIO()
+        writer = pymupdf.DocumentWriter(out_file)
+        self.page = 0
+        self.toc = []
+
         more = 1
         while more:  # loop outputting the story
             self.page += 1
-            device = self.writer.begin_page(rect)
+            device = writer.begin_page(rect)
             more, _ = story.place(where)  # layout into allowed rectangle
             story.element_positions(self.recorder, {"toc": toc, "pdfile": self})
             story.draw(device)
-            self.writer.end_page()
+            writer.end_page()
+
+        writer.close()
+        return out_file.getvalue(), self.toc
+
+    def add_article(
+        self, article: FullArticle, user_css: str | None = None, toc: bool = True
+    ) -> None:
+        self.rendered.append(self.render_article(article, user_css, toc))
+
+    def add_rendered_article(self, rendered: RenderedArticle) -> None:
+        """Add an article which has already been laid out, e.g. by another process"""
+        self.rendered.append(rendered)
 
     def save(self) -> io.BytesIO:
-        """Save pdf to file."""
-        self.writer.close()
-        print(self.out_file.getbuffer().nbytes)
-        doc: pymupdf.Document = pymupdf.Document("pdf", self.out_file)
+        """Merge the rendered articles into one pdf, offsetting their TOC entries."""
+        doc: pymupdf.Document = pymupdf.open()
+        toc: list[TocEntry] = []
+
+        for pdf, article_toc in self.rendered:
+            offset = doc.page_count
+
+            with pymupdf.open(stream=pdf, filetype="pdf") as article_doc:
+                doc.insert_pdf(article_doc)
+
+            toc.extend(
+                (level, text, page + offset, top)
+                for level, text, page, top in article_toc
+            )
+
         doc.set_metadata({**self.meta, "title": self.title})  # pyright: ignore
 
         if self.toc_level > 0:
-            doc.set_toc(self.toc)  # pyright: ignore
+            doc.set_toc(toc)  # pyright: ignore
+
+        out_file = io.BytesIO()
+        doc.save(out_file)
+        doc.close()
+
+        return out_file
+
+
+# Renderer reused between articles within the same worker process
+_process_renderer: MarkdownPdf | None = None
+
+
+def render_article(article: FullArticle) -> RenderedArticle:
+    """Entrypoint for laying out articles in a process pool"""
+    global _process_renderer
+
+    if _process_renderer is None:
+        _process_renderer = MarkdownPdf("")
 
-        doc.save(self.out_file)
-        return self.out_file
+    return _process_renderer.render_article(article)
@@ -0,0 +1,269 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from hashlib import sha256
+import json
+from logging import getLogger
+import multiprocessing
+import os
+import re
+import time
+from typing import Literal, TypedDict
+
+from modules.objects import BaseArticle, FullArticle
+
+from .. import config_options
+from .pdf import MarkdownPdf, RenderedArticle, render_article
+
+logger = getLogger("osinter")
+
+PdfJobStatus = Literal["pending", "done", "failed"]
+
+
+class PdfJob(TypedDict):
+    id: str
+    status: PdfJobStatus
+
+
+job_id_pattern = re.compile(r"^[A-Z0-9-]+-[0-9a-f]{32}$")
+
+# Pending markers older than this are assumed to belong to a crashed worker
+PENDING_TIMEOUT = 15 * 60
+CLEANUP_INTERVAL = 60 * 60
+
+pdf_cache_dir = os.path.join(config_options.CACHE_DIR, "pdf")
+os.makedirs(pdf_cache_dir, exist_ok=True)
+
+running_jobs: dict[str, asyncio.Task[None]] = {}
+
+_pool: ProcessPoolExecutor | None = None
+_cleanup_task: asyncio.Task[None] | None = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # Created lazily so that each gunicorn worker gets its own pool after forking
+    global _pool
+
+    if _pool is None:
+        # Renderers are started from a fork server instead of being forked from the
+        # worker, which is multithreaded and running an event loop
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload([render_article.__module__])
+
+        _pool = ProcessPoolExecutor(
+            max_workers=config_options.PDF_RENDER_WORKERS, mp_context=context
+        )
+
+    return _pool
+
+
+def reset_pool(broken_pool: ProcessPoolExecutor) -> None:
+    """Drops a pool that can't be used anymore, so that the next job creates a new one"""
+    global _pool
+
+    if _pool is broken_pool:
+        _pool = None
+
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+    if _cleanup_task is not None:
+        _cleanup_task.cancel()
+
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+
+
+def merge_pdf(title: str, rendered_articles: list[RenderedArticle]) -> bytes:
+    pdf_creator = MarkdownPdf(title)
+
+    for rendered in rendered_articles:
+        pdf_creator.add_rendered_article(rendered)
+
+    return pdf_creator.save().getvalue()
+
+
+async def render_pdf(title: str, articles: list[FullArticle]) -> bytes:
+    """Lays out the articles in parallel across the pool, and merges them in a thread"""
+    loop = asyncio.get_running_loop()
+
+    for attempt in range(2):
+        pool = get_pool()
+
+        try:
+            rendered_articles = await asyncio.gather(
+                *(
+                    loop.run_in_executor(pool, render_article, article)
+                    for article in articles
+                )
+            )
+            break
+        except BrokenProcessPool:
+            # A renderer was killed, for instance by running out of memory
+            logger.warning("PDF render pool is broken, creating a new one")
+            reset_pool(pool)
+
+            if attempt > 0:
+                raise
+
+    return await loop.run_in_executor(None, merge_pdf, title, rendered_articles)
+
+
+def get_job_id(
+    name: str,
+    articles: list[BaseArticle] | list[FullArticle],
+    source_exclusions: list[str],
+) -> str:
+    # Exclusions are part of the hash, as they determine the content of the articles
+    article_hash = sha256(
+        " ".join(
+            [*(article.id for article in articles), "|", *sorted(source_exclusions)]
+        ).encode()
+    )
+    return f"{name.upper()}-{article_hash.hexdigest()[:32]}"
+
+
+def get_job_path(job_id: str) -> str:
+    if not job_id_pattern.fullmatch(job_id):
+        raise ValueError(f'Invalid job id "{job_id}"')
+
+    return os.path.join(pdf_cache_dir, f"{job_id}.pdf")
+
+
+def allow_access(job_id: str, source_exclusions: list[str]) -> None:
+    """Stores the exclusions the job is rendered with, keeping its files from expiring"""
+    with open(f"{get_job_path(job_id)}.access", "w") as f:
+        json.dump(sorted(source_exclusions), f)
+
+
+def has_access(job_id: str, source_exclusions: list[str]) -> bool:
+    """
+    Whether the PDF of the job only contains articles visible with the given source
+    exclusions, which is the case if it was rendered excluding at least those sources
+    """
+    try:
+        with open(f"{get_job_path(job_id)}.access") as f:
+            job_exclusions: list[str] = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+
+    return set(source_exclusions).issubset(job_exclusions)
+
+
+def get_job_status(job_id: str) -> PdfJobStatus | None:
+    path = get_job_path(job_id)
+
+    if os.path.isfile(path):
+        return "done"
+    elif job_id in running_jobs:
+        return "pending"
+    elif os.path.isfile(f"{path}.failed"):
+        return "failed"
+
+    try:
+        if time.time() - os.path.getmtime(f"{path}.pending") < PENDING_TIMEOUT:
+            return "pending"
+    except FileNotFoundError:
+        pass
+
+    return None
+
+
+async def run_job(job_id: str, title: str, articles: list[FullArticle]) -> None:
+    path = get_job_path(job_id)
+
+    try:
+        pdf = await render_pdf(title, articles)
+
+        with open(f"{path}.tmp", "wb") as f:
+            f.write(pdf)
+
+        os.replace(f"{path}.tmp", path)
+    except Exception as e:
+        logger.error(f'Error when rendering pdf for job "{job_id}": {e}')
+        open(f"{path}.failed", "w").close()
+    finally:
+        running_jobs.pop(job_id, None)
+
+        try:
+            os.remove(f"{path}.pending")
+        except FileNotFoundError:
+            pass
+
+
+def submit_job(job_id: str, title: str, articles: list[FullArticle]) -> PdfJob:
+    status = get_job_status(job_id)
+
+    if status == "done" or status == "pending":
+        return {"id": job_id, "status": status}
+
+    path = get_job_path(job_id)
+    open(f"{path}.pending", "w").close()
+
+    try:
+        os.remove(f"{path}.failed")
+    except FileNotFoundError:
+        pass
+
+    running_jobs[job_id] = asyncio.create_task(run_job(job_id, title, articles))
+
+    return {"id": job_id, "status": "pending"}
+
+
+async def wait_for_job(job_id: str, poll_interval: float = 0.5) -> PdfJobStatus | None:
+    if job_id in running_jobs:
+        await asyncio.shield(running_jobs[job_id])
+
+    # The job might be rendered by another worker
+    while (status := get_job_status(job_id)) == "pending":
+        await asyncio.sleep(poll_interval)
+
+    return status
+
+
+def remove_expired_jobs(ttl: int) -> None:
+    """Removes the files of jobs that haven't been written to within the ttl"""
+    last_modified: dict[str, float] = {}
+    paths: dict[str, list[str]] = {}
+
+    with os.scandir(pdf_cache_dir) as entries:
+        for entry in entries:
+            # Files of a job are named by the job id followed by their extensions
+            job_id = entry.name.split(".")[0]
+
+            try:
+                modified = entry.stat().st_mtime
+            except FileNotFoundError:
+                continue
+
+            last_modified[job_id] = max(last_modified.get(job_id, 0), modified)
+            paths.setdefault(job_id, []).append(entry.path)
+
+    now = time.time()
+
+    for job_id, modified in last_modified.items():
+        if job_id in running_jobs or now - modified < ttl:
+            continue
+
+        for path in paths[job_id]:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+async def clean_cache(ttl: int) -> None:
+    while True:
+        try:
+            await asyncio.to_thread(remove_expired_jobs, ttl)
+        except Exception as e:
+            logger.error(f"Error when removing expired PDF jobs: {e}")
+
+        await asyncio.sleep(CLEANUP_INTERVAL)
+
+
+def start_cleanup() -> None:
+    global _cleanup_task
+
+    _cleanup_task = asyncio.create_task(clean_cache(config_options.PDF_CACHE_TTL))
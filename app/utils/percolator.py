@@ -0,0 +1,147 @@
+"""
+Feeds are registered as percolator queries in a separate index, so that a batch of new
+articles can be matched against every feed in a single request. The queries are
+generated the same way as when searching the articles of a feed
+"""
+
+from collections.abc import Iterable, Sequence
+from logging import getLogger
+import time
+from typing import Any
+from uuid import UUID
+
+from elasticsearch import Elasticsearch, NotFoundError
+from elasticsearch.helpers import bulk
+
+from app import config_options
+from app.dependencies import FastapiArticleSearchQuery
+from app.users import schemas
+
+from .elastic import es_async_conn, search_kwargs
+
+logger = getLogger("osinter")
+
+# An alias, pointing to the index built most recently by create_index
+index_name = config_options.ELASTICSEARCH_FEED_INDEX
+
+
+def feed_query(feed: schemas.FeedCreate) -> dict[str, Any]:
+    query: dict[str, Any] = search_kwargs(
+        config_options.es_article_client,
+        FastapiArticleSearchQuery.from_item(feed, []),
+        False,
+    ).get("query", {"match_all": {}})
+
+    return query
+
+
+def percolator_document(feed: schemas.Feed) -> dict[str, Any]:
+    return {"query": feed_query(feed), "feed_id": str(feed.id)}
+
+
+def index_feed(feed: schemas.Feed) -> None:
+    try:
+        config_options.es_article_client.es.index(
+            index=index_name, id=str(feed.id), document=percolator_document(feed)
+        )
+    except Exception as e:
+        logger.error(f'Error when registering percolator for feed "{feed.id}": {e}')
+
+
+async def index_feed_async(feed: schemas.Feed) -> None:
+    try:
+        await es_async_conn.index(
+            index=index_name, id=str(feed.id), document=percolator_document(feed)
+        )
+    except Exception as e:
+        logger.error(f'Error when registering percolator for feed "{feed.id}": {e}')
+
+
+def remove_feed(feed_id: UUID) -> None:
+    try:
+        config_options.es_article_client.es.delete(index=index_name, id=str(feed_id))
+    except NotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f'Error when removing percolator for feed "{feed_id}": {e}')
+
+
+def create_index(es: Elasticsearch, feeds: Iterable[schemas.Feed]) -> None:
+    """
+    Builds a new index with the mapping and analyzers of the article index, as
+    percolator queries are parsed against the fields of the index they're stored in.
+    The alias is only moved to the new index once every feed is registered, so that
+    articles are never percolated against a missing or partially filled index
+    """
+    new_index = f"{index_name}-{int(time.time())}"
+    article_index = config_options.es_article_client.index_name
+
+    # Keyed by the concrete index, which might differ from an alias
+    mappings = next(iter(es.indices.get_mapping(index=article_index).values()))
+    settings = next(iter(es.indices.get_settings(index=article_index).values()))
+
+    properties = {
+        **mappings["mappings"].get("properties", {}),
+        "query": {"type": "percolator"},
+        "feed_id": {"type": "keyword"},
+    }
+    analysis = settings["settings"]["index"].get("analysis")
+
+    es.indices.create(
+        index=new_index,
+        mappings={"properties": properties},
+        settings={"analysis": analysis} if analysis else None,
+    )
+
+    bulk(
+        es,
+        (
+            {"_index": new_index, "_id": str(feed.id), **percolator_document(feed)}
+            for feed in feeds
+        ),
+        refresh=True,
+    )
+
+    actions: list[dict[str, Any]] = [{"add": {"index": new_index, "alias": index_name}}]
+    old_indices: list[str] = []
+
+    if es.indices.exists_alias(name=index_name):
+        old_indices = list(es.indices.get_alias(name=index_name))
+        actions.extend(
+            {"remove": {"index": index, "alias": index_name}} for index in old_indices
+        )
+    elif es.indices.exists(index=index_name):
+        # Index from before it was replaced by an alias
+        actions.append({"remove_index": {"index": index_name}})
+
+    es.indices.update_aliases(actions=actions)
+
+    for index in old_indices:
+        es.indices.delete(index=index)
+
+
+async def percolate(
+    documents: Sequence[dict[str, Any]], batch_size: int = 1_000
+) -> dict[str, list[int]]:
+    """Returns the ids of the feeds matching the documents, along with their indices"""
+    matches: dict[str, list[int]] = {}
+    search_after: list[Any] | None = None
+
+    while True:
+        response = await es_async_conn.search(
+            index=index_name,
+            size=batch_size,
+            sort=[{"feed_id": "asc"}],
+            search_after=search_after,
+            query={"percolate": {"field": "query", "documents": documents}},
+            source=False,
+        )
+        hits = response["hits"]["hits"]
+
+        for hit in hits:
+            matches[hit["_id"]] = hit["fields"]["_percolator_document_slot"]
+
+        if len(hits) < batch_size:
+            return matches
+
+        search_after = hits[-1]["sort"]
@@ -0,0 +1,140 @@
+import asyncio
+from collections import Counter, OrderedDict
+from logging import getLogger
+from threading import Lock
+from typing import Any
+from uuid import UUID
+
+from couchdb.http import ResourceConflict
+
+from app import config_options
+from app.users import async_crud
+
+from .elastic import es_article_async_client
+
+logger = getLogger("osinter")
+
+increment_read_times = """
+if (ctx._source.read_times == null) {
+    ctx._source.read_times = params.count;
+} else {
+    ctx._source.read_times += params.count;
+}
+"""
+
+
+class ReadTracker:
+    """
+    Buffers article reads in memory and writes them periodically, so that reading an
+    article doesn't cause a write to both Elasticsearch and CouchDB. Read counters
+    are incremented through a single bulk request, and the reads of each user are
+    merged into their read history with one write per user per flush.
+    """
+
+    def __init__(self, flush_interval: float) -> None:
+        self.flush_interval = flush_interval
+        self.lock = Lock()
+
+        self.read_counts: Counter[str] = Counter()
+        # Article ids ordered from least to most recently read
+        self.user_reads: dict[UUID, OrderedDict[str, None]] = {}
+
+        self.task: asyncio.Task[None] | None = None
+        self.stopping = asyncio.Event()
+
+    def record(self, article_id: str, user_id: UUID | None) -> None:
+        with self.lock:
+            self.read_counts[article_id] += 1
+
+            if user_id:
+                reads = self.user_reads.setdefault(user_id, OrderedDict())
+                reads[article_id] = None
+                reads.move_to_end(article_id)
+
+    async def flush(self) -> None:
+        with self.lock:
+            read_counts, self.read_counts = self.read_counts, Counter()
+            user_reads, self.user_reads = self.user_reads, {}
+
+        if read_counts:
+            await self.flush_read_counts(read_counts)
+
+        for user_id, reads in user_reads.items():
+            await self.flush_user_reads(user_id, list(reads))
+
+    async def flush_read_counts(self, read_counts: Counter[str]) -> None:
+        operations: list[dict[str, Any]] = []
+
+        for article_id, count in read_counts.items():
+            operations.append(
+                {
+                    "update": {
+                        "_index": es_article_async_client.index_name,
+                        "_id": article_id,
+                    }
+                }
+            )
+            operations.append(
+                {"script": {"source": increment_read_times, "params": {"count": count}}}
+            )
+
+        try:
+            response = await es_article_async_client.es.bulk(operations=operations)
+        except Exception as e:
+            logger.error(f"Error when updating read counters: {e}")
+            return
+
+        if response["errors"]:
+            logger.warning("Failed to update the read counter of some articles")
+
+    async def flush_user_reads(
+        self, user_id: UUID, article_ids: list[str], attempts: int = 3
+    ) -> None:
+        """Merges the read article ids, ordered by least recent, into the read history"""
+        user = await async_crud.get_user(user_id)
+        if not user:
+            return
+
+        for _ in range(attempts):
+            history = await async_crud.get_read_history(user)
+            history.add(article_ids, config_options.READ_HISTORY_SIZE)
+
+            try:
+                await async_crud.save_read_history(history)
+                return
+            except ResourceConflict:
+                continue
+            except Exception as e:
+                logger.error(f'Error when saving reads of user "{user_id}": {e}')
+                return
+
+        logger.error(f'Failed to save reads of user "{user_id}" due to conflicts')
+
+    async def run(self) -> None:
+        while not self.stopping.is_set():
+            try:
+                await asyncio.wait_for(self.stopping.wait(), self.flush_interval)
+            except TimeoutError:
+                pass
+
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error when flushing article reads: {e}")
+
+    def start(self) -> None:
+        self.stopping.clear()
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            # Signalled instead of cancelled, so that a flush in progress isn't
+            # interrupted after it has swapped out the buffered reads
+            self.stopping.set()
+            await self.task
+            self.task = None
+
+        await self.flush()
+
+
+read_tracker = ReadTracker(config_options.READ_FLUSH_INTERVAL)
@@ -0,0 +1,149 @@
+"""
+Feeds with webhooks attached keep a watermark of the articles already sent to them,
+consisting of the insertion time of the newest article along with the ids of the
+articles sent within WEBHOOK_INDEX_LAG of it. New articles are queried in insertion
+order from the watermark minus the lag, so that every article is sent once no matter
+how many arrive between runs, even if it becomes searchable after newer articles
+"""
+
+from collections.abc import Sequence
+from typing import Any
+
+from app import config_options
+from app.dependencies import FastapiArticleSearchQuery
+from app.users import schemas
+
+from modules.objects import BaseArticle
+
+from .elastic import article_models, parse_hits, search_kwargs
+
+
+def feed_search_kwargs(feed: schemas.Feed) -> dict[str, Any]:
+    kwargs = search_kwargs(
+        config_options.es_article_client,
+        FastapiArticleSearchQuery.from_item(feed, []),
+        False,
+    )
+
+    for key in ["size", "sort", "search_after", "aggs", "aggregations"]:
+        kwargs.pop(key, None)
+
+    return kwargs
+
+
+def index_lag() -> int:
+    return int(config_options.WEBHOOK_INDEX_LAG * 1000)
+
+
+def is_after(watermark: schemas.FeedWebhooks, hit: dict[str, Any]) -> bool:
+    """Whether a hit sorted by insertion time hasn't been passed by the watermark"""
+    if watermark.last_inserted_at is None:
+        return True
+
+    inserted_at: int = hit["sort"][0]
+
+    return (
+        inserted_at >= watermark.last_inserted_at - index_lag()
+        and hit["_id"] not in watermark.recently_sent
+    )
+
+
+def advance_watermark(
+    watermark: schemas.FeedWebhooks, hits: Sequence[dict[str, Any]]
+) -> schemas.FeedWebhooks:
+    """Moves the watermark past hits sorted by ascending insertion time"""
+    watermark = watermark.model_copy(deep=True)
+
+    for hit in hits:
+        inserted_at: int = hit["sort"][0]
+
+        last_inserted_at = watermark.last_inserted_at
+
+        if last_inserted_at is None or inserted_at >= last_inserted_at:
+            watermark.last_inserted_at = inserted_at
+            watermark.last_article = hit["_id"]
+
+        watermark.recently_sent[hit["_id"]] = inserted_at
+
+    if watermark.last_inserted_at is not None:
+        oldest = watermark.last_inserted_at - index_lag()
+        watermark.recently_sent = {
+            id: inserted_at
+            for id, inserted_at in watermark.recently_sent.items()
+            if inserted_at >= oldest
+        }
+
+    return watermark
+
+
+def after_watermark(
+    watermark: schemas.FeedWebhooks, query: dict[str, Any] | None = None
+) -> dict[str, Any]:
+    """Restricts the query to the articles that haven't been passed by the watermark"""
+    return {
+        "bool": {
+            "must": query or {"match_all": {}},
+            "filter": {
+                "range": {
+                    "inserted_at": {
+                        "gte": (watermark.last_inserted_at or 0) - index_lag(),
+                        "format": "epoch_millis",
+                    }
+                }
+            },
+            "must_not": {"ids": {"values": list(watermark.recently_sent)}},
+        }
+    }
+
+
+def newest_watermark(hits: Sequence[dict[str, Any]]) -> schemas.FeedWebhooks:
+    """Watermark placed at the newest of hits sorted by descending insertion time"""
+    oldest = hits[0]["sort"][0] - index_lag()
+    newest = [hit for hit in hits if hit["sort"][0] >= oldest]
+
+    return advance_watermark(schemas.FeedWebhooks(), newest[::-1])
+
+
+def latest_watermark(feed: schemas.Feed) -> schemas.FeedWebhooks:
+    """Watermark placed at the newest article of the feed"""
+    kwargs = feed_search_kwargs(feed)
+    kwargs.pop("source", None)
+
+    response = config_options.es_article_client.es.search(
+        index=config_options.es_article_client.index_name,
+        size=100,
+        sort=[{"inserted_at": "desc"}],
+        source=False,
+        **kwargs,
+    )
+    hits: list[dict[str, Any]] = response["hits"]["hits"]
+
+    if not hits:
+        # Every article of the feed is new, as it has none yet
+        return schemas.FeedWebhooks(last_inserted_at=0)
+
+    return newest_watermark(hits)
+
+
+def query_new_articles(
+    feed: schemas.Feed, limit: int
+) -> tuple[list[BaseArticle], schemas.FeedWebhooks]:
+    """
+    Returns up to `limit` of the oldest articles after the watermark of the feed, along
+    with the watermark moved past them
+    """
+    watermark = feed.webhooks
+    kwargs = feed_search_kwargs(feed)
+
+    query = after_watermark(watermark, kwargs.pop("query", None))
+
+    response = config_options.es_article_client.es.search(
+        index=config_options.es_article_client.index_name,
+        size=limit,
+        sort=[{"inserted_at": "asc"}],
+        query=query,
+        **kwargs,
+    )
+    hits: list[dict[str, Any]] = response["hits"]["hits"]
+
+    return parse_hits(hits, article_models, False), advance_watermark(watermark, hits)
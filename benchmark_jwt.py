@@ -0,0 +1,29 @@
+"""
+Micro-benchmark of the cost of verifying the access token on every request, using
+python-jose directly and through the token cache used by get_id_from_token
+
+Usage: python benchmark_jwt.py [iterations]
+"""
+
+import sys
+import timeit
+
+from app.users.auth.token import TokenCache, create_access_token, decode_token
+
+iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+
+token = create_access_token({"sub": "00000000-0000-0000-0000-000000000000"})
+
+cache = TokenCache(1_000)
+cache.get_id(token)
+
+benchmarks = {
+    "python-jose": lambda: decode_token(token),
+    # Digest of the token, followed by a decode as nothing is cached
+    "cache miss": lambda: TokenCache(0).get_id(token),
+    "cache hit": lambda: cache.get_id(token),
+}
+
+for name, benchmark in benchmarks.items():
+    seconds = timeit.timeit(benchmark, number=iterations)
+    print(f"{name:>12}: {seconds / iterations * 1_000_000:8.2f} µs per token")
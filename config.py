@@ -1,8 +1,13 @@
 from datetime import timedelta
+from http.client import HTTPConnection
 import os
 import secrets
+from threading import BoundedSemaphore, RLock, get_ident
+from typing import Any, TypedDict
+import weakref
 
 from couchdb import Server
+from couchdb.http import ConnectionPool, Session
 
 from modules.config import BaseConfig
 
@@ -26,6 +31,147 @@ def load_secret_key() -> str:
         return current_secret_key
 
 
+class CouchPoolStats(TypedDict):
+    size: int
+    in_use: int
+    idle: int
+    waiting: int
+    saturation: float
+
+
+class BoundedConnectionPool(ConnectionPool):  # type: ignore[misc]
+    """
+    Connection pool for the CouchDB client, which by default opens a new connection
+    whenever none are idle and keeps every one of them around. At most `size`
+    connections are checked out at once, with other threads waiting up to
+    `acquire_timeout` seconds for one to be released, and at most `size` idle
+    keep-alive connections are kept per host.
+
+    The client doesn't release connections of requests that raise, which are
+    returned by BoundedSession, nor connections closed while streaming a response,
+    whose slot is freed once the connection is garbage collected.
+    """
+
+    def __init__(self, timeout: float | None, size: int, acquire_timeout: float) -> None:
+        super().__init__(timeout)
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.slots = BoundedSemaphore(size)
+
+        # Reentrant, as slots might be freed by the garbage collector while held
+        self.stats_lock = RLock()
+        # Finalizer, thread and checkout number of each checked out connection
+        self.checked_out: dict[
+            int, tuple[weakref.finalize[[int], HTTPConnection], int, int]
+        ] = {}
+        self.checkouts = 0
+        self.in_use = 0
+        self.waiting = 0
+
+    def get(self, url: str) -> HTTPConnection:
+        with self.stats_lock:
+            self.waiting += 1
+
+        acquired = self.slots.acquire(timeout=self.acquire_timeout)
+
+        with self.stats_lock:
+            self.waiting -= 1
+
+        if not acquired:
+            raise TimeoutError("Timed out waiting for a CouchDB connection")
+
+        try:
+            conn: HTTPConnection = super().get(url)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        with self.stats_lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.checked_out[id(conn)] = (
+                weakref.finalize(conn, self.free_slot, id(conn)),
+                get_ident(),
+                self.checkouts,
+            )
+
+        return conn
+
+    def checkout_count(self) -> int:
+        with self.stats_lock:
+            return self.checkouts
+
+    def discard(self, since: int) -> None:
+        """
+        Closes the connections checked out by the current thread after the given
+        checkout number that haven't been released, and frees their slots
+        """
+        with self.stats_lock:
+            abandoned = [
+                (conn_id, finalizer)
+                for conn_id, (finalizer, thread, number) in self.checked_out.items()
+                if thread == get_ident() and number > since
+            ]
+
+        for conn_id, finalizer in abandoned:
+            # Detaching returns None if the slot has already been freed
+            if detached := finalizer.detach():
+                detached[0].close()
+                self.free_slot(conn_id)
+
+    def free_slot(self, conn_id: int) -> None:
+        with self.stats_lock:
+            self.checked_out.pop(conn_id, None)
+            self.in_use -= 1
+
+        self.slots.release()
+
+    def release(self, url: str, conn: HTTPConnection) -> None:
+        super().release(url, conn)
+
+        with self.lock:
+            for conns in self.conns.values():
+                while len(conns) > self.size:
+                    conns.pop(0).close()
+
+        with self.stats_lock:
+            entry = self.checked_out.pop(id(conn), None)
+
+        if entry is not None and entry[0].detach() is not None:
+            self.free_slot(id(conn))
+
+    def stats(self) -> CouchPoolStats:
+        with self.lock:
+            idle = sum(len(conns) for conns in self.conns.values())
+
+        with self.stats_lock:
+            return {
+                "size": self.size,
+                "in_use": self.in_use,
+                "idle": idle,
+                "waiting": self.waiting,
+                "saturation": self.in_use / self.size,
+            }
+
+
+class BoundedSession(Session):  # type: ignore[misc]
+    """
+    Session for the bounded connection pool. The client leaves the connection of a
+    request checked out when the request raises, so it's discarded here instead
+    """
+
+    connection_pool: BoundedConnectionPool
+
+    def request(self, *args: Any, **kwargs: Any) -> Any:
+        since = self.connection_pool.checkout_count()
+
+        try:
+            return super().request(*args, **kwargs)
+        except BaseException:
+            self.connection_pool.discard(since)
+            raise
+
+
 class FrontendConfig(BaseConfig):
     def __init__(self) -> None:
         super().__init__()
@@ -47,6 +193,29 @@ class FrontendConfig(BaseConfig):
         )
 
         self.JWT_ALGORITHMS = (os.environ.get("JWT_ALGORITHMS") or "HS256").split(" ")
+        self.JWT_CACHE_SIZE = int(os.environ.get("JWT_CACHE_SIZE") or 10_000)
+
+        # Defaults match those of argon2-cffi. Existing hashes are rehashed with the
+        # current parameters when users log in
+        self.ARGON2_TIME_COST = int(os.environ.get("ARGON2_TIME_COST") or 3)
+        self.ARGON2_MEMORY_COST = int(os.environ.get("ARGON2_MEMORY_COST") or 65536)
+        self.ARGON2_PARALLELISM = int(os.environ.get("ARGON2_PARALLELISM") or 4)
+
+        self.HASH_WORKERS = int(os.environ.get("HASH_WORKERS") or 2)
+        self.HASH_MAX_PENDING = int(os.environ.get("HASH_MAX_PENDING") or 16)
+
+        # Login attempts allowed in a burst and refilled per minute. Set the store to
+        # "sqlite" to share the limits between the workers on a host
+        self.LOGIN_THROTTLE_STORE = os.environ.get("LOGIN_THROTTLE_STORE") or "memory"
+        self.LOGIN_THROTTLE_DB = (
+            os.environ.get("LOGIN_THROTTLE_DB") or "cache/login_throttle.db"
+        )
+        self.LOGIN_IP_BURST = int(os.environ.get("LOGIN_IP_BURST") or 20)
+        self.LOGIN_IP_PER_MINUTE = float(os.environ.get("LOGIN_IP_PER_MINUTE") or 10)
+        self.LOGIN_USERNAME_BURST = int(os.environ.get("LOGIN_USERNAME_BURST") or 5)
+        self.LOGIN_USERNAME_PER_MINUTE = float(
+            os.environ.get("LOGIN_USERNAME_PER_MINUTE") or 2
+        )
 
         self.ENABLE_HTTPS = self.get_env_bool("ENABLE_HTTPS")
         self.ML_CLUSTERING_AVAILABLE = self.get_env_bool("ML_CLUSTERING_AVAILABLE")
@@ -55,7 +224,26 @@ class FrontendConfig(BaseConfig):
 
         self.EMAIL_SERVER_AVAILABLE = self.get_env_bool("EMAIL_SERVER_AVAILABLE")
 
-        self.couch_conn = Server(self.COUCHDB_URL)[self.COUCHDB_NAME]
+        self.COUCHDB_POOL_SIZE = int(os.environ.get("COUCHDB_POOL_SIZE") or 20)
+        self.COUCHDB_POOL_TIMEOUT = float(os.environ.get("COUCHDB_POOL_TIMEOUT") or 10)
+        self.COUCHDB_TIMEOUT = float(os.environ.get("COUCHDB_TIMEOUT") or 30)
+        self.COUCHDB_RETRY_DELAYS = [
+            float(delay)
+            for delay in (os.environ.get("COUCHDB_RETRY_DELAYS") or "0 0.5 1").split(" ")
+        ]
+
+        # Shared by all threads in the worker
+        self.couch_pool = BoundedConnectionPool(
+            self.COUCHDB_TIMEOUT, self.COUCHDB_POOL_SIZE, self.COUCHDB_POOL_TIMEOUT
+        )
+        couch_session = BoundedSession(
+            timeout=self.COUCHDB_TIMEOUT, retry_delays=self.COUCHDB_RETRY_DELAYS
+        )
+        couch_session.connection_pool = self.couch_pool
+
+        self.couch_conn = Server(self.COUCHDB_URL, session=couch_session)[
+            self.COUCHDB_NAME
+        ]
 
         self.id = uuid4()
 
@@ -63,6 +251,57 @@ class FrontendConfig(BaseConfig):
             os.environ.get("ARTICLE_RENDER_URL") or "https://osinter.dk/article"
         )
 
+        self.CACHE_DIR = os.environ.get("CACHE_DIR") or "cache"
+        self.FRONTPAGE_CACHE_TTL = int(os.environ.get("FRONTPAGE_CACHE_TTL") or 300)
+        self.FRONTPAGE_CACHE_STALE_TTL = int(
+            os.environ.get("FRONTPAGE_CACHE_STALE_TTL") or 3600
+        )
+
+        self.USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE") or 10_000)
+        self.API_KEY_CACHE_TTL = int(os.environ.get("API_KEY_CACHE_TTL") or 300)
+
+        self.READ_HISTORY_SIZE = int(os.environ.get("READ_HISTORY_SIZE") or 1000)
+        self.READ_FLUSH_INTERVAL = float(os.environ.get("READ_FLUSH_INTERVAL") or 10)
+
+        # Connections shared by the webhook connectors, and the number of concurrent
+        # deliveries allowed to each host
+        self.CONNECTOR_POOL_SIZE = int(os.environ.get("CONNECTOR_POOL_SIZE") or 100)
+        self.CONNECTOR_HOST_CONCURRENCY = int(
+            os.environ.get("CONNECTOR_HOST_CONCURRENCY") or 10
+        )
+        self.CONNECTOR_DNS_TTL = int(os.environ.get("CONNECTOR_DNS_TTL") or 300)
+        self.CONNECTOR_TIMEOUT = float(os.environ.get("CONNECTOR_TIMEOUT") or 30)
+
+        # Failed webhook deliveries are retried with exponential backoff, waiting
+        # within a run for at most WEBHOOK_MAX_WAIT seconds before keeping them in
+        # the retry file for a later run
+        self.WEBHOOK_RETRY_DB = (
+            os.environ.get("WEBHOOK_RETRY_DB") or "cache/webhook_deliveries.db"
+        )
+        self.WEBHOOK_MAX_ATTEMPTS = int(os.environ.get("WEBHOOK_MAX_ATTEMPTS") or 8)
+        self.WEBHOOK_MAX_WAIT = float(os.environ.get("WEBHOOK_MAX_WAIT") or 60)
+        self.WEBHOOK_RETRY_BACKOFF = float(
+            os.environ.get("WEBHOOK_RETRY_BACKOFF") or 5
+        )
+
+        # Index holding the queries of all feeds for percolating new articles
+        self.ELASTICSEARCH_FEED_INDEX = (
+            os.environ.get("ELASTICSEARCH_FEED_INDEX") or "osinter_feeds"
+        )
+
+        # Seconds an article might take to become searchable after its insertion time,
+        # which new articles are queried with as an overlap
+        self.WEBHOOK_INDEX_LAG = float(os.environ.get("WEBHOOK_INDEX_LAG") or 300)
+
+        # Seconds between each poll for new articles when webhooks.py runs as a daemon
+        self.WEBHOOK_POLL_INTERVAL = float(
+            os.environ.get("WEBHOOK_POLL_INTERVAL") or 60
+        )
+
+        self.PDF_RENDER_WORKERS = int(os.environ.get("PDF_RENDER_WORKERS") or 2)
+        # Seconds before rendered PDFs and the files of their jobs are removed
+        self.PDF_CACHE_TTL = int(os.environ.get("PDF_CACHE_TTL") or 24 * 60 * 60)
+
         self.FULL_LOGO_URL = os.environ.get("FULL_LOGO_URL") or "https://osinter.dk/fullLogo.png"
         self.SMALL_LOGO_URL = os.environ.get("SMALL_LOGO_URL") or "https://osinter.dk/fullLogo.png"
 
@@ -1,5 +1,6 @@
 # Standard config section
 import multiprocessing
+import os
 
 max_requests = 1000
 max_requests_jitter = 50
@@ -7,3 +8,7 @@ max_requests_jitter = 50
 log_file = "-"
 
 workers = multiprocessing.cpu_count() * 2 + 1
+
+# Addresses of the reverse proxies trusted to set X-Forwarded-For, which is used as the
+# address of the client when throttling logins. Comma separated, or * to trust any
+forwarded_allow_ips = os.environ.get("FORWARDED_ALLOW_IPS") or "127.0.0.1"
@@ -20,4 +20,67 @@ from app import config_options
 
 from app.users.models import views
 
-ViewDefinition.sync_many(config_options.couch_conn, views)
+# Design documents are replaced in full, so views no longer defined are removed
+ViewDefinition.sync_many(config_options.couch_conn, views, remove_missing=True)
+
+# Frees the disk used by indexes of outdated view definitions
+config_options.couch_conn.cleanup()
+
+from app.users.schemas import ReadHistory
+
+# Moves read articles from the user documents to separate read history documents
+migrated_docs = []
+
+for row in config_options.couch_conn.view("users/all", include_docs=True):
+    user_doc = row.doc
+    if "read_articles" not in user_doc:
+        continue
+
+    history_id = ReadHistory.get_id(user_doc["_id"])
+    if history_id not in config_options.couch_conn:
+        history = ReadHistory(_id=history_id, owner=user_doc["_id"])
+        history.add(
+            reversed(user_doc["read_articles"]), config_options.READ_HISTORY_SIZE
+        )
+        migrated_docs.append(history.db_serialize())
+
+    del user_doc["read_articles"]
+    migrated_docs.append(user_doc)
+
+config_options.couch_conn.update(migrated_docs)
+
+from app.users.schemas import Feed
+from app.utils.percolator import create_index
+
+# Registers every feed as a percolator query, used to match new articles to webhooks
+create_index(
+    config_options.es_article_client.es,
+    (
+        Feed.model_validate(row.doc)
+        for row in config_options.couch_conn.view("feeds/all", include_docs=True)
+    ),
+)
+
+from app.utils.watermarks import advance_watermark, latest_watermark
+
+# Gives feeds from before watermarks one positioned at their last sent article
+migrated_feeds = []
+
+for row in config_options.couch_conn.view("feeds/all", include_docs=True):
+    feed = Feed.model_validate(row.doc)
+    if feed.webhooks.last_inserted_at is not None or not feed.webhooks.last_article:
+        continue
+
+    hits = config_options.es_article_client.es.search(
+        index=config_options.es_article_client.index_name,
+        query={"ids": {"values": [feed.webhooks.last_article]}},
+        sort=[{"inserted_at": "asc"}],
+        source=False,
+    )["hits"]["hits"]
+
+    feed.webhooks = (
+        advance_watermark(feed.webhooks, hits) if hits else latest_watermark(feed)
+    )
+    migrated_feeds.append(feed.db_serialize())
+
+config_options.couch_conn.update(migrated_feeds)
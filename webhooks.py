@@ -1,72 +1,115 @@
+from argparse import ArgumentParser
 import asyncio
 import logging
-from collections.abc import Coroutine
-from typing import Any
+from collections.abc import Mapping
+from typing import Any, cast
 from uuid import UUID
-from couchdb.client import ViewResults
 from concurrent.futures import ThreadPoolExecutor
 
 from app import config_options
-from app.users import models, schemas
-from app.dependencies import FastapiArticleSearchQuery
+from app.users import async_crud, models, schemas
+from app.users.crud import get_user_items
 from app.connectors import connectors, webhook_types
+from app.connectors.delivery import Delivery, delivery_scheduler
+from app.connectors.runtime import connector_runtime
+from app.utils.couch import couch_async_conn
+from app.utils.elastic import (
+    article_models,
+    es_article_async_client,
+    es_async_conn,
+    parse_hits,
+)
+from app.utils.percolator import index_feed_async, percolate, percolator_document
+from app.utils.watermarks import (
+    advance_watermark,
+    after_watermark,
+    is_after,
+    latest_watermark,
+    newest_watermark,
+    query_new_articles,
+)
 
 from modules.objects import BaseArticle
 
 logger = logging.getLogger("osinter")
 
 
-def get_articles(
-    feeds: list[schemas.Feed],
-) -> list[tuple[schemas.Feed, list[BaseArticle]]]:
-    def query(feed: schemas.Feed) -> tuple[schemas.Feed, list[BaseArticle]] | None:
-        q = FastapiArticleSearchQuery.from_item(feed, [])
-        q.limit = min(q.limit, 50)
-        articles = config_options.es_article_client.query_documents(q, False)[0]
-        articles.reverse()
+# A feed along with its new articles and its watermark moved past them
+FeedUpdate = tuple[schemas.Feed, list[BaseArticle], schemas.FeedWebhooks]
 
-        existing_article_index: None | int = None
 
-        if feed.webhooks.last_article:
-            for i, article in enumerate(articles):
-                if article.id == feed.webhooks.last_article:
-                    existing_article_index = i
+def get_articles(feeds: list[schemas.Feed]) -> list[FeedUpdate]:
+    def query(feed: schemas.Feed) -> FeedUpdate | None:
+        if feed.webhooks.last_inserted_at is None:
+            logger.warning(
+                f"Missing watermark for feed with ID {feed.id}. Starting from newest article"
+            )
+            return (feed, [], latest_watermark(feed))
 
-        if existing_article_index is not None:
-            articles = articles[existing_article_index + 1 :]
-            logger.debug(f"Found {len(articles)} articles for feed with ID {feed.id}")
-        else:
-            logger.warning(f"Missing last article for feed with ID {feed.id}")
+        articles, watermark = query_new_articles(feed, min(feed.limit or 50, 50))
+        logger.debug(f"Found {len(articles)} articles for feed with ID {feed.id}")
 
-        return (feed, articles) if len(articles) > 0 else None
+        return (feed, articles, watermark) if len(articles) > 0 else None
 
     with ThreadPoolExecutor(max_workers=20) as executor:
         return [bundle for bundle in executor.map(query, feeds) if bundle]
 
 
+async def send_articles(
+    feed_with_articles: list[tuple[schemas.Feed, list[BaseArticle]]],
+    webhook_by_feed: dict[UUID, list[schemas.Webhook]],
+    webhooks: Mapping[str, schemas.Webhook],
+) -> None:
+    ### Generating webhook deliveries ###
+    deliveries: list[Delivery] = []
+
+    logger.debug("Generating webhook deliveries")
+    for feed, articles in feed_with_articles:
+        feed_webhooks: list[schemas.Webhook] = webhook_by_feed[feed.id]
+
+        for webhook in feed_webhooks:
+            connector = connectors[webhook.hook_type]
+            messages = connector["format"](articles, feed.name)
+
+            for payload in connector["payloads"](messages):  # type: ignore[arg-type]
+                deliveries.append(
+                    Delivery(
+                        webhook_id=str(webhook.id),
+                        url=webhook.url.get_secret_value(),
+                        hook_type=webhook.hook_type,
+                        payload=payload,
+                    )
+                )
+
+    # Earlier deliveries due for a retry are sent along with the new ones
+    logger.debug("Running webhook deliveries")
+    await delivery_scheduler.run(deliveries, webhooks)
+
+
 # Used to handle feeds which have potentially been updated in the meantime
 def update_feeds(
-    existing_feeds: list[tuple[schemas.Feed, str]], depth: int = 1
+    existing_feeds: list[tuple[schemas.Feed, schemas.FeedWebhooks]], depth: int = 1
 ) -> None:
     logger.debug(f"Trying to update {len(existing_feeds)} feeds. Attempt nr. {depth}")
-    new_feeds_view: ViewResults = models.Feed.all(config_options.couch_conn)
-    new_feeds_view.options["keys"] = [str(feed.id) for (feed, _) in existing_feeds]
-    new_feeds = [schemas.Feed.model_validate(feed) for feed in new_feeds_view]
+    new_feeds = cast(
+        list[schemas.Feed],
+        get_user_items([feed.id for (feed, _) in existing_feeds], "feed"),
+    )
     new_feeds_lookup = {feed.id: feed for feed in new_feeds}
 
     feeds_to_update: list[dict[str, Any]] = []
 
-    for feed, last_article in existing_feeds:
+    for feed, watermark in existing_feeds:
         if not feed.id in new_feeds_lookup:
             logger.error(f"Missing feed with ID {feed.id} during feed update")
             continue
 
         new_feed = new_feeds_lookup[feed.id]
 
-        # If last_article has been updated, then such has the content of the feed
-        # and last_article shouldn't be updated
-        if new_feed.webhooks.last_article == feed.webhooks.last_article:
-            new_feed.webhooks.last_article = last_article
+        # If the watermark has been updated, then such has the content of the feed
+        # and the watermark shouldn't be updated
+        if new_feed.webhooks == feed.webhooks:
+            new_feed.webhooks = watermark
             feeds_to_update.append(new_feed.db_serialize())
         else:
             logger.warning(
@@ -77,9 +120,9 @@ def update_feeds(
     update_response = config_options.couch_conn.update(feeds_to_update)
 
     failed_ids: list[str] = [id for (success, id, _) in update_response if not success]
-    failed_feeds: list[tuple[schemas.Feed, str]] = []
+    failed_feeds: list[tuple[schemas.Feed, schemas.FeedWebhooks]] = []
     existing_feed_lookup = {
-        feed.id: (feed, article_id) for (feed, article_id) in existing_feeds
+        feed.id: (feed, watermark) for (feed, watermark) in existing_feeds
     }
 
     for id in failed_ids:
@@ -113,16 +156,14 @@ async def main() -> None:
     logger.debug("Querying webhooks")
     webhooks = [
         schemas.Webhook.model_validate(webhook)
-        for webhook in models.Webhook.all(config_options.couch_conn)
+        for webhook in models.Webhook.all(config_options.couch_conn, include_docs=True)
     ]
     feeds_ids = {id for webhook in webhooks for id in webhook.attached_feeds}
 
     logger.debug(
         f"Found {len(webhooks)} webhooks. Querying related feeds. Expecting {len(feeds_ids)}"
     )
-    feeds_view: ViewResults = models.Feed.all(config_options.couch_conn)
-    feeds_view.options["keys"] = [str(id) for id in feeds_ids]
-    feeds = [schemas.Feed.model_validate(feed) for feed in feeds_view]
+    feeds = cast(list[schemas.Feed], get_user_items(feeds_ids, "feed"))
     found_ids = [feed.id for feed in feeds]
 
     if len(feeds_ids) != len(feeds):
@@ -152,36 +193,288 @@ async def main() -> None:
 
     ### Query articles for feeds ###
     logger.debug("Querying articles for feeds")
-    feed_with_articles = get_articles(feeds)
+    feed_updates = get_articles(feeds)
 
-    if len(feed_with_articles) < 1:
+    if len(feed_updates) < 1:
         logger.debug("No feeds with new articles found")
-        return
     else:
-        logger.debug(f"Found {len(feed_with_articles)} feeds with new articles")
+        logger.debug(f"Found {len(feed_updates)} feeds with new articles")
 
-    ### Generating webhook tasks ###
-    webhook_tasks: list[Coroutine[None, None, None]] = []
+    await send_articles(
+        [(feed, articles) for feed, articles, _ in feed_updates if articles],
+        webhook_by_feed,
+        {str(webhook.id): webhook for webhook in webhooks},
+    )
 
-    logger.debug("Generating webhook actions")
-    for feed, articles in feed_with_articles:
-        feed_webhooks: list[schemas.Webhook] = webhook_by_feed[feed.id]
+    if feed_updates:
+        update_feeds([(feed, watermark) for feed, _, watermark in feed_updates])
 
-        for webhook in feed_webhooks:
-            connector = connectors[webhook.hook_type]
-            messages = connector["format"](articles, feed.name)
-            webhook_tasks.append(
-                connector["send_messages"](
-                    [webhook.url.get_secret_value()],
-                    messages,  # type: ignore[arg-type]
+
+# Deleted documents are included, as their tombstones don't contain the type
+changes_selector = {
+    "$or": [{"type": {"$in": ["feed", "webhook"]}}, {"_deleted": True}]
+}
+
+
+class WebhookDispatcher:
+    """
+    Long running alternative to main. Webhooks and their feeds are kept in memory and
+    updated from the CouchDB changes feed, while Elasticsearch is polled once per
+    interval for every article inserted after a global high-water mark. The new
+    articles are percolated against the queries of all feeds at once, so the cost of a
+    poll scales with the number of new articles rather than with the number of feeds
+    """
+
+    def __init__(self, interval: float, batch_size: int = 500) -> None:
+        self.interval = interval
+        self.batch_size = batch_size
+
+        self.webhooks: dict[str, schemas.Webhook] = {}
+        self.feeds: dict[str, schemas.Feed] = {}
+        self.since = "now"
+
+        # High-water mark of the dispatched articles, which works like the watermarks
+        # of the feeds but covers every article
+        self.watermark = schemas.FeedWebhooks(last_inserted_at=0)
+
+        # Rebuilt whenever the webhooks change
+        self.webhook_by_feed: dict[UUID, list[schemas.Webhook]] = {}
+
+    async def load(self) -> None:
+        # Read first, so that changes made while loading are replayed afterwards
+        self.since = str((await couch_async_conn.request("GET", ""))["update_seq"])
+
+        rows = await couch_async_conn.view(models.Webhook.all, include_docs=True)
+        self.webhooks = {
+            row["id"]: schemas.Webhook.model_validate(row["doc"]) for row in rows
+        }
+
+        await self.load_feeds()
+        self.build_indexes()
+
+        response = await es_async_conn.search(
+            index=es_article_async_client.index_name,
+            size=self.batch_size,
+            sort=[{"inserted_at": "desc"}],
+            source=False,
+        )
+        hits = response["hits"]["hits"]
+
+        if hits:
+            self.watermark = newest_watermark(hits)
+
+        logger.debug(
+            f"Loaded {len(self.webhooks)} webhooks and {len(self.feeds)} feeds"
+        )
+
+    async def load_feeds(self) -> None:
+        """Loads attached feeds that aren't in memory, and drops detached ones"""
+        attached = {
+            str(id)
+            for webhook in self.webhooks.values()
+            for id in webhook.attached_feeds
+        }
+        self.feeds = {id: feed for id, feed in self.feeds.items() if id in attached}
+
+        missing_ids = attached - self.feeds.keys()
+        if missing_ids:
+            feeds = cast(
+                list[schemas.Feed], await async_crud.get_user_items(missing_ids, "feed")
+            )
+            self.feeds.update({str(feed.id): feed for feed in feeds})
+
+    def build_indexes(self) -> None:
+        self.webhook_by_feed = {}
+
+        for webhook in self.webhooks.values():
+            if webhook.hook_type not in webhook_types:
+                logger.error(
+                    f"Got unsupported webhook of type {webhook.hook_type}. ID: '{webhook.id}'"
+                )
+                continue
+
+            for feed_id in webhook.attached_feeds:
+                self.webhook_by_feed.setdefault(feed_id, []).append(webhook)
+
+    async def follow_changes(self) -> None:
+        response = await couch_async_conn.request(
+            "POST",
+            "_changes",
+            params={"since": self.since, "include_docs": "true", "filter": "_selector"},
+            body={"selector": changes_selector},
+        )
+        self.since = str(response["last_seq"])
+
+        if not response["results"]:
+            return
+
+        for change in response["results"]:
+            id = change["id"]
+
+            if change.get("deleted"):
+                self.webhooks.pop(id, None)
+                self.feeds.pop(id, None)
+            elif change["doc"].get("type") == "webhook":
+                self.webhooks[id] = schemas.Webhook.model_validate(change["doc"])
+            else:
+                feed = schemas.Feed.model_validate(change["doc"])
+                previous = self.feeds.get(id)
+                document = percolator_document(feed)
+
+                # Registered again, as registering the feed from the routes might have
+                # failed. Skipped when only the watermark has changed
+                if not previous or percolator_document(previous) != document:
+                    await index_feed_async(feed)
+
+                if id in self.feeds:
+                    self.feeds[id] = feed
+
+        logger.debug(f"Applied {len(response['results'])} changes to webhooks or feeds")
+
+        await self.load_feeds()
+        self.build_indexes()
+
+    async def fetch_new_articles(self) -> list[dict[str, Any]]:
+        """
+        Returns the articles not yet passed by the high-water mark as raw hits. The mark
+        itself is left to be moved once the articles have been dispatched, so that
+        they're fetched again if dispatching fails
+        """
+        results: list[dict[str, Any]] = []
+        watermark = self.watermark
+
+        while True:
+            response = await es_async_conn.search(
+                index=es_article_async_client.index_name,
+                size=self.batch_size,
+                sort=[{"inserted_at": "asc"}],
+                query=after_watermark(watermark),
+            )
+            hits = response["hits"]["hits"]
+
+            results.extend(hits)
+            watermark = advance_watermark(watermark, hits)
+
+            if len(hits) < self.batch_size:
+                return results
+
+    async def match(self, hits: list[dict[str, Any]]) -> tuple[list[FeedUpdate], int]:
+        """
+        Returns the updates for feeds with new articles, along with the number of hits
+        that have been fully dispatched. Like the one-shot run, at most `limit` of the
+        oldest new articles are sent to a feed at once, and the hits from the first one
+        held back are fetched again on the next tick
+        """
+        articles: list[BaseArticle] = parse_hits(hits, article_models, False)
+        slots_by_feed: dict[str, list[int]] = {}
+
+        for offset in range(0, len(hits), self.batch_size):
+            matches = await percolate(
+                [hit["_source"] for hit in hits[offset : offset + self.batch_size]]
+            )
+
+            for feed_id, slots in matches.items():
+                slots_by_feed.setdefault(feed_id, []).extend(
+                    offset + slot for slot in slots
+                )
+
+        feed_updates: list[FeedUpdate] = []
+        dispatched = len(hits)
+
+        for feed_id, slots in slots_by_feed.items():
+            # Every feed is registered, including those without webhooks
+            feed = self.feeds.get(feed_id)
+            if not feed or feed.id not in self.webhook_by_feed:
+                continue
+
+            # Skips articles already sent while catching up on startup
+            limit = min(feed.limit or 50, 50)
+            new_slots = [
+                slot for slot in sorted(slots) if is_after(feed.webhooks, hits[slot])
+            ]
+
+            if len(new_slots) > limit:
+                dispatched = min(dispatched, new_slots[limit])
+                new_slots = new_slots[:limit]
+
+            if new_slots:
+                feed_updates.append(
+                    (
+                        feed,
+                        [articles[slot] for slot in new_slots],
+                        advance_watermark(
+                            feed.webhooks, [hits[slot] for slot in new_slots]
+                        ),
+                    )
                 )
+
+        return feed_updates, dispatched
+
+    async def tick(self) -> None:
+        await self.follow_changes()
+
+        feed_updates: list[FeedUpdate] = []
+        dispatched = 0
+
+        hits = await self.fetch_new_articles()
+        if hits:
+            logger.debug(f"Found {len(hits)} new articles. Matching against feeds")
+            feed_updates, dispatched = await self.match(hits)
+
+        # Run even without new articles, to retry earlier deliveries
+        await send_articles(
+            [(feed, articles) for feed, articles, _ in feed_updates],
+            self.webhook_by_feed,
+            self.webhooks,
+        )
+
+        # Kept up to date so that the one-shot run can take over from the daemon
+        if feed_updates:
+            await asyncio.to_thread(
+                update_feeds,
+                [(feed, watermark) for feed, _, watermark in feed_updates],
             )
 
-    logger.debug("Running webhook actions")
-    await asyncio.gather(*webhook_tasks, return_exceptions=True)
+        self.watermark = advance_watermark(self.watermark, hits[:dispatched])
 
-    update_feeds([(feed, articles[-1].id) for feed, articles in feed_with_articles])
+    async def run(self) -> None:
+        while True:
+            try:
+                await self.tick()
+            except Exception as e:
+                logger.error(f"Error when dispatching webhooks: {e}")
+
+            await asyncio.sleep(self.interval)
+
+
+async def daemon() -> None:
+    dispatcher = WebhookDispatcher(config_options.WEBHOOK_POLL_INTERVAL)
+
+    # The high-water mark is set before catching up on articles inserted since the
+    # last run, so none are missed. Those sent while catching up are skipped through
+    # the watermarks of the feeds
+    await dispatcher.load()
+    await main()
+    await dispatcher.run()
+
+
+async def run(as_daemon: bool) -> None:
+    try:
+        await (daemon() if as_daemon else main())
+    finally:
+        await connector_runtime.close()
+        await couch_async_conn.close()
+        await es_async_conn.close()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    parser = ArgumentParser(
+        description="Sends new articles to the webhooks attached to feeds"
+    )
+    parser.add_argument(
+        "--daemon",
+        action="store_true",
+        help="Keep running, polling for new articles every WEBHOOK_POLL_INTERVAL",
+    )
+
+    asyncio.run(run(parser.parse_args().daemon))